@@ -0,0 +1,136 @@
+import os
+import itertools
+import time
+import tracemalloc
+
+import numpy as np
+import soundfile as sf
+import pytsmod as tsm
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'tests', 'data')
+
+# the processing time of the algorithms with their default parameters.
+# ×realtime is the duration of the input divided by the processing time,
+# and the allocation peak is the largest memory allocated by numpy
+# during a call, without the input.
+# pv_int uses the nearest integer stretch factor.
+ALGORITHMS = {
+    'ola': lambda x, s, sr, **kw: tsm.ola(x, s, **kw),
+    'wsola': lambda x, s, sr, **kw: tsm.wsola(x, s, **kw),
+    'pv': lambda x, s, sr, **kw: tsm.phase_vocoder(x, s, **kw),
+    'pv_phase_lock': lambda x, s, sr, **kw: tsm.phase_vocoder(
+        x, s, phase_lock=True, **kw),
+    'pv_int': lambda x, s, sr, **kw: tsm.phase_vocoder_int(
+        x, max(1, int(round(s))), **kw),
+    'hptsm': lambda x, s, sr, **kw: tsm.hptsm(x, s, **kw),
+    'tdpsola': lambda x, s, sr, **kw: _tdpsola(x, s, sr, **kw),
+}
+
+# the window and hop parameters of each algorithm, and the ratio between
+# them. The grains of tdpsola follow the pitch instead of a window.
+WIN_PARAMS = {'ola': ('win_size', 'syn_hop_size', 2),
+              'wsola': ('win_size', 'syn_hop_size', 2),
+              'pv': ('win_size', 'syn_hop_size', 4),
+              'pv_phase_lock': ('win_size', 'syn_hop_size', 4),
+              'pv_int': ('win_size', 'syn_hop_size', 4),
+              'hptsm': ('pv_win_size', 'pv_syn_hop_size', 4)}
+
+
+def _signal(seconds, channels):
+    """The orchestra recording repeated to the duration,
+    with the channels shifted from each other."""
+    x, sr = sf.read(os.path.join(DATA_DIR, 'beethovenorchestra.wav'))
+    x = np.resize(x, int(seconds * sr))
+    return np.stack([np.roll(x, 37 * c) for c in range(channels)]), sr
+
+
+def _tdpsola(x, s, sr, **kwargs):
+    # a constant f0 is enough for the timing, the pitch marks
+    # are found on the whole signal.
+    p_hop_size = 441
+    f0 = np.full(x.shape[-1] // p_hop_size + 1, 220.)
+    return tsm.tdpsola(x, sr, f0, alpha=s, p_hop_size=p_hop_size, **kwargs)
+
+
+def _realtime_factor(func, x, sr, repeat=3):
+    # the best of some runs, as timeit.
+    elapsed = min(_elapsed(func) for _ in range(repeat))
+    return x.shape[-1] / sr / elapsed
+
+
+def _elapsed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def _allocation_peak(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+class TSM:
+    """Every algorithm across durations, channels and stretch factors."""
+    params = (list(ALGORITHMS), [10, 60], [1, 2], [0.8, 1.5])
+    param_names = ['algorithm', 'seconds', 'channels', 'alpha']
+    timeout = 600
+
+    def setup(self, algorithm, seconds, channels, alpha):
+        self.x, self.sr = _signal(seconds, channels)
+        func = ALGORITHMS[algorithm]
+        self.run = lambda: func(self.x, alpha, self.sr)
+
+    def time_tsm(self, algorithm, seconds, channels, alpha):
+        self.run()
+
+    def peakmem_tsm(self, algorithm, seconds, channels, alpha):
+        self.run()
+
+    def track_realtime_factor(self, algorithm, seconds, channels, alpha):
+        return _realtime_factor(self.run, self.x, self.sr)
+    track_realtime_factor.unit = 'x realtime'
+
+    def track_allocation_peak(self, algorithm, seconds, channels, alpha):
+        return _allocation_peak(self.run)
+    track_allocation_peak.unit = 'MiB'
+
+
+class WindowSize:
+    """Every algorithm across window sizes, for 30 s of stereo input."""
+    params = (list(WIN_PARAMS), [512, 1024, 2048, 4096])
+    param_names = ['algorithm', 'win_size']
+    timeout = 600
+
+    def setup(self, algorithm, win_size):
+        self.x, self.sr = _signal(30, 2)
+        func = ALGORITHMS[algorithm]
+        win_param, hop_param, ratio = WIN_PARAMS[algorithm]
+        kwargs = {win_param: win_size, hop_param: win_size // ratio}
+        self.run = lambda: func(self.x, 1.3, self.sr, **kwargs)
+
+    def time_tsm(self, algorithm, win_size):
+        self.run()
+
+    def track_realtime_factor(self, algorithm, win_size):
+        return _realtime_factor(self.run, self.x, self.sr)
+    track_realtime_factor.unit = 'x realtime'
+
+    def track_allocation_peak(self, algorithm, win_size):
+        return _allocation_peak(self.run)
+    track_allocation_peak.unit = 'MiB'
+
+
+if __name__ == '__main__':
+    # a quick table without asv, for sizing from the numbers of a machine.
+    print('algorithm,seconds,channels,alpha,x_realtime,allocation_peak_mib')
+    for args in itertools.product(*TSM.params):
+        bench = TSM()
+        bench.setup(*args)
+        print(','.join(map(str, args)),
+              f'{bench.track_realtime_factor(*args):.2f}',
+              f'{bench.track_allocation_peak(*args):.1f}', sep=',',
+              flush=True)
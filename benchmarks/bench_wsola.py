@@ -0,0 +1,52 @@
+import os
+
+import numpy as np
+import soundfile as sf
+import pytsmod as tsm
+from pytsmod.wsolatsm import _search, _cross_corr, _fft_size
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'tests', 'data')
+
+
+class WSOLASearch:
+    """Coarse-to-fine similarity search compared to the exact search."""
+    params = ([1, 2, 4, 8], [512, 2048])
+    param_names = ['search_decimation', 'tolerance']
+    timeout = 300
+
+    def setup(self, search_decimation, tolerance):
+        self.x, _ = sf.read(os.path.join(DATA_DIR, 'beethovenorchestra.wav'))
+
+        # frame pairs around the natural progression of random windows.
+        win_size = 1024
+        rng = np.random.default_rng(0)
+        pos = rng.integers(tolerance + 1000, self.x.size - 2 * tolerance
+                           - 2 * win_size, size=300)
+        next_pos = pos + win_size // 2 + rng.integers(-300, 300, size=pos.size)
+        self.nat_prog = [self.x[None, p: p + win_size] for p in pos]
+        self.x_next = [self.x[None, p - tolerance: p + win_size + tolerance]
+                       for p in next_pos]
+
+    def time_wsola(self, search_decimation, tolerance):
+        tsm.wsola(self.x, 1.25, tolerance=tolerance,
+                  search_decimation=search_decimation)
+
+    def _shifts(self, search_decimation, tolerance):
+        n_fft = _fft_size(1024, tolerance, 'auto', search_decimation)
+        exact = []
+        found = []
+        for nat_prog, x_next in zip(self.nat_prog, self.x_next):
+            cross_corr = _cross_corr(nat_prog, x_next)[0]
+            delta = _search(nat_prog, x_next, tolerance, n_fft,
+                            search_decimation)[0]
+            exact.append(np.max(cross_corr))
+            found.append(cross_corr[delta + tolerance])
+        return np.array(exact), np.array(found)
+
+    def track_exact_shift_ratio(self, search_decimation, tolerance):
+        exact, found = self._shifts(search_decimation, tolerance)
+        return np.mean(found == exact)
+
+    def track_correlation_ratio(self, search_decimation, tolerance):
+        exact, found = self._shifts(search_decimation, tolerance)
+        return np.mean(found / exact)
@@ -6,3 +6,7 @@ from .wsolatsm import *
 from .hptsm import *
 from .pvtsm import *
 from .olatsm import *
+from .fileio import *
+from . import parallel
+from .utils.threads import *
+from .utils.profiling import *
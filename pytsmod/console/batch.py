@@ -0,0 +1,239 @@
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+from pytsmod import process_file
+
+
+ALGORITHMS = ['ola', 'wsola', 'pv', 'pv_int', 'hptsm']
+
+
+def add_batch_parser(subparsers, c):
+    """Add the parser of the batch subcommand.
+
+    Parameters
+    ----------
+
+    subparsers : argparse._SubParsersAction
+                 the subparsers of the tsmod parser.
+    c : configparser.SectionProxy
+        the descriptions of the arguments.
+    """
+    parser_batch = subparsers.add_parser('batch', help=c['BATCH_HELP'],
+                                         description=c['BATCH_DESC'])
+    parser_batch.add_argument('source', type=str, help=c['SOURCE_HELP'])
+    parser_batch.add_argument('--output_dir', '-o', default=None, type=str,
+                              help=c['OUTDIR_HELP'])
+    parser_batch.add_argument('--algorithm', '-a', default='wsola', type=str,
+                              choices=ALGORITHMS, help=c['ALGO_HELP'])
+    parser_batch.add_argument('--alpha', default=None, type=float,
+                              help=c['A_BATCH_HELP'])
+    parser_batch.add_argument('--params', '-p', default='{}', type=str,
+                              help=c['PARAMS_HELP'])
+    parser_batch.add_argument('--jobs', '-j', default=os.cpu_count(),
+                              type=int, help=c['JOBS_HELP'])
+    parser_batch.add_argument('--report', '-r', default=None, type=str,
+                              help=c['REPORT_HELP'])
+    parser_batch.add_argument('--quiet', '-q', action='store_true',
+                              help=c['QUIET_HELP'])
+
+
+def run_batch(args):
+    """Process every job of the batch and print the summary.
+
+    Parameters
+    ----------
+
+    args : argparse.Namespace
+           the parsed arguments of the batch subcommand.
+
+    Returns
+    -------
+
+    status : int
+             0 if every file is processed, 1 otherwise.
+    """
+    default = {'algorithm': args.algorithm, 'alpha': args.alpha,
+               'params': json.loads(args.params)}
+    jobs = load_jobs(args.source, args.output_dir, default)
+
+    start = time.perf_counter()
+    failed = []
+    report = open(args.report, 'w') if args.report else None
+
+    for n, (job, error, elapsed) in enumerate(_run_jobs(jobs, args.jobs), 1):
+        if error is not None:
+            failed.append((job, error))
+        if not args.quiet:
+            status = f'FAILED: {error}' if error else f'{elapsed:.2f} s'
+            print(f"[{n}/{len(jobs)}] {job.get('input')} ({status})",
+                  file=sys.stderr)
+        if report is not None:
+            report.write(json.dumps({**job, 'error': error,
+                                     'seconds': round(elapsed, 4)}) + '\n')
+
+    if report is not None:
+        report.close()
+
+    total = time.perf_counter() - start
+    print(f'{len(jobs) - len(failed)} processed, {len(failed)} failed '
+          + f'in {total:.2f} s.')
+    for job, error in failed:
+        print(f"  {job.get('input')}: {error}")
+
+    return 1 if failed else 0
+
+
+def load_jobs(source, output_dir=None, default=None):
+    """Read the jobs of the batch from a manifest or a glob pattern.
+
+    A manifest is a CSV file with a header, a JSON array of objects
+    or a JSON lines file, with the fields input, output, algorithm,
+    alpha and params.
+    params is a JSON object of the keyword arguments of the algorithm.
+    Only input and output are required, the others are taken from default.
+    Any other source is a glob pattern of the input files,
+    which are written to output_dir with the same paths relative to
+    the directory of the pattern, e.g. in/a/x.wav to out/a/x.wav
+    for in/**/*.wav.
+    The jobs are validated when they are processed, so that a row
+    without input or output, or whose output is its input,
+    fails alone without stopping the others.
+
+    Parameters
+    ----------
+
+    source : str
+             path of the manifest (.csv, .json or .jsonl) or a glob pattern.
+    output_dir : str
+                 directory of the outputs for a glob pattern.
+    default : dict
+              default algorithm, alpha and params of the jobs.
+
+    Returns
+    -------
+
+    jobs : list of dict
+           the jobs with input, output, algorithm, alpha and params.
+           alpha and params are parsed when each job is processed.
+    """
+    default = {'algorithm': 'wsola', 'alpha': None, 'params': {},
+               **(default or {})}
+
+    ext = os.path.splitext(source)[1].lower()
+    if ext == '.csv':
+        with open(source, newline='') as f:
+            rows = list(csv.DictReader(f))
+    elif ext == '.json':
+        with open(source) as f:
+            rows = json.load(f)
+    elif ext == '.jsonl':
+        with open(source) as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    else:
+        if output_dir is None:
+            raise Exception("Please use the valid output directory "
+                            + "for the glob pattern.")
+        # the directories below the first pattern are kept,
+        # so that the files with the same name do not overwrite each other.
+        base = os.path.dirname(source)
+        while glob.has_magic(base):
+            base = os.path.dirname(base)
+        rows = [{'input': p,
+                 'output': os.path.join(output_dir,
+                                        os.path.relpath(p, base or '.'))}
+                for p in sorted(glob.glob(source, recursive=True))]
+
+    return [_parse_job(row, default) for row in rows]
+
+
+def _parse_job(row, default):
+    # empty CSV cells fall back to the default values.
+    row = {k: v for k, v in row.items() if v not in (None, '')}
+    return {**default, **row}
+
+
+def _check_job(job):
+    """Validate a job of the batch and convert its fields.
+
+    Parameters
+    ----------
+
+    job : dict
+          the job as read from the source.
+
+    Returns
+    -------
+
+    job : dict
+          the job with the parsed alpha and params.
+    """
+    if 'input' not in job or 'output' not in job:
+        raise Exception("Please use the valid manifest row "
+                        + "with input and output.")
+    if os.path.realpath(job['output']) == os.path.realpath(job['input']):
+        raise Exception("Please use the valid output path, "
+                        + "which is not the input.")
+    if job['alpha'] is None:
+        raise Exception("Please use the valid stretching factor alpha.")
+
+    job = dict(job)
+    if isinstance(job['params'], str):
+        job['params'] = json.loads(job['params'])
+    job['alpha'] = float(job['alpha'])
+    # phase_vocoder_int only takes integer stretching factors.
+    if job['algorithm'] == 'pv_int' and job['alpha'].is_integer():
+        job['alpha'] = int(job['alpha'])
+
+    return job
+
+
+def _run_jobs(jobs, n_jobs):
+    # the worker processes import pytsmod once and take many files each.
+    if n_jobs is None or n_jobs <= 1 or len(jobs) <= 1:
+        yield from map(_process_job, jobs)
+        return
+
+    chunk_size = max(1, min(16, len(jobs) // (4 * n_jobs)))
+    with Pool(n_jobs) as pool:
+        yield from pool.imap_unordered(_process_job, jobs, chunk_size)
+
+
+def _process_job(job):
+    """Process one file of the batch.
+    The errors, including the invalid jobs, are returned instead of raised,
+    so that a failing file does not stop the batch.
+
+    Parameters
+    ----------
+
+    job : dict
+          the job with input, output, algorithm, alpha and params.
+
+    Returns
+    -------
+
+    job : dict
+          the processed job.
+    error : str or None
+            the error message, or None if the file is processed.
+    elapsed : float
+              the processing time of the file in seconds.
+    """
+    start = time.perf_counter()
+    try:
+        job = _check_job(job)
+
+        out_dir = os.path.dirname(job['output'])
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        process_file(job['input'], job['output'], job['algorithm'],
+                     job['alpha'], **job['params'])
+    except Exception as e:
+        return job, f'{type(e).__name__}: {e}', time.perf_counter() - start
+
+    return job, None, time.perf_counter() - start
@@ -1,11 +1,9 @@
 import sys
 sys.path.append('./')
 
-import soundfile as sf
-from pytsmod import ola, wsola
-from pytsmod import phase_vocoder as pv
-from pytsmod import phase_vocoder_int as pv_int
+from pytsmod import process_file
 from pytsmod import __path__ as path
+from pytsmod.console.batch import add_batch_parser, run_batch
 
 import configparser
 import argparse
@@ -47,6 +45,11 @@ def run():
                               help=c['SH_HELP'])
     parser_wsola.add_argument('--tolerance', '-t', default=512, type=int,
                               help=c['TOL_HELP'])
+    parser_wsola.add_argument('--xcorr', '-xc', default='auto', type=str,
+                              choices=['auto', 'direct', 'fft'],
+                              help=c['XC_HELP'])
+    parser_wsola.add_argument('--search_decimation', '-sd', default=1,
+                              type=int, help=c['SD_HELP'])
 
     # create parser for phase-vocoder.
     parser_pv = subparsers.add_parser('pv', help=c['PV_HELP'],
@@ -68,6 +71,8 @@ def run():
                            help=c['FS_HELP'])
     parser_pv.add_argument('--phase_lock', '-pl', action='store_true',
                            help=c['PL_HELP'])
+    parser_pv.add_argument('--channel_link', '-cl', default=None, type=str,
+                           choices=['mid', 'sum'], help=c['CL_HELP'])
 
     # create parser for phase-vocoder int.
     parser_pvi = subparsers.add_parser('pv_int', help=c['PVI_HELP'],
@@ -88,32 +93,32 @@ def run():
     parser_pvi.add_argument('--fft_shift', '-fs', action='store_true',
                             help=c['FS_HELP'])
 
+    # the input is read and written block by block.
+    for parser in [parser_ola, parser_wsola, parser_pv, parser_pvi]:
+        parser.add_argument('--block_size', '-b', default=65536, type=int,
+                            help=c['BS_HELP'])
+
+    # the input and output files are memory-mapped.
+    for parser in [parser_ola, parser_wsola, parser_pv]:
+        parser.add_argument('--mmap', '-m', action='store_true',
+                            help=c['MM_HELP'])
+
+    # create parser for processing many files.
+    add_batch_parser(subparsers, c)
+
     args = a_parser.parse_args()
 
-    x, sr = sf.read(args.input_file)
-
-    if args.subparser_name == 'ola':
-        y = ola(x, args.alpha, win_type=args.win_type, win_size=args.win_size,
-                syn_hop_size=args.syn_hop_size)
-    elif args.subparser_name == 'wsola':
-        y = wsola(x, args.alpha, win_type=args.win_type,
-                  win_size=args.win_size, syn_hop_size=args.syn_hop_size,
-                  tolerance=args.tolerance)
-    elif args.subparser_name == 'pv':
-        y = pv(x, args.alpha, win_type=args.win_type, win_size=args.win_size,
-               syn_hop_size=args.syn_hop_size, zero_pad=args.zero_pad,
-               restore_energy=args.restore_energy, fft_shift=args.fft_shift,
-               phase_lock=args.phase_lock)
-    elif args.subparser_name == 'pv_int':
-        y = pv_int(x, args.alpha, win_type=args.win_type,
-                   win_size=args.win_size, syn_hop_size=args.syn_hop_size,
-                   zero_pad=args.zero_pad,
-                   restore_energy=args.restore_energy,
-                   fft_shift=args.fft_shift)
-    # elif args.subparser_name == 'hp':
-    #     pass
-
-    sf.write(args.output_file, y.T, sr)
+    if args.subparser_name == 'batch':
+        sys.exit(run_batch(args))
+
+    # the remaining arguments are the parameters of the algorithm.
+    params = vars(args)
+    algo = params.pop('subparser_name')
+    input_file = params.pop('input_file')
+    output_file = params.pop('output_file')
+    alpha = params.pop('alpha')
+
+    process_file(input_file, output_file, algo, alpha, **params)
 
 
 if __name__ == '__main__':
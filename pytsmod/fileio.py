@@ -0,0 +1,241 @@
+import os
+import struct
+
+import numpy as np
+import soundfile as sf
+from .wsolatsm import wsola, WSOLAStream
+from .olatsm import ola
+from .pvtsm import phase_vocoder, phase_vocoder_int, PhaseVocoderStream
+from .hptsm import hptsm
+from .utils import _validate_scale_factor
+
+
+__all__ = ['process_file']
+
+
+def process_file(in_path, out_path, algo='wsola', s=1, block_size=65536,
+                 subtype=None, dtype=np.float64, mmap=False, **kwargs):
+    """Modify length of an audio file and write the result to another file.
+
+    For a constant time stretching factor, ola, wsola and pv are streamed:
+    the input is read block by block, and the output is written
+    as soon as it is ready, so the memory usage is bounded by the block size
+    instead of the length of the file. The output is the same as
+    processing the whole file at once.
+    Other algorithms and anchor points read the whole file.
+
+    With mmap, the input and the output are memory-mapped WAV files,
+    so that files larger than the memory can be processed
+    with any time stretching factor.
+    The output is written by ola, wsola and pv in place,
+    and the phase vocoder is run in blocks of block_size samples.
+
+    Parameters
+    ----------
+
+    in_path : str
+              path of the input audio file.
+    out_path : str
+               path of the output audio file.
+               The format is chosen by the extension.
+    algo : str
+           the TSM algorithm. ola, wsola, pv, pv_int and hptsm are available.
+    s : number > 0 [scalar] or numpy.ndarray [shape=(2, num_points)]
+        the time stretching factor. Either a constant value (alpha)
+        or an 2 x n array of anchor points which contains the sample points
+        of the input signal in the first row
+        and the sample points of the output signal in the second row.
+    block_size : int > 0 [scalar]
+                 number of samples read at once.
+    subtype : str or None
+              subtype of the output file.
+              None uses the default subtype of the format.
+    dtype : numpy.dtype
+            floating point type of the computation.
+    mmap : bool
+           memory-map the input and the output files.
+           Only ola, wsola and pv with a WAV input of FLOAT or DOUBLE subtype
+           are available. The output is a WAV file of the subtype of dtype,
+           and subtype is ignored.
+    kwargs : the parameters of the algorithm.
+
+    Returns
+    -------
+
+    output_length : int >= 0 [scalar]
+                    number of samples written to the output file.
+    """
+    if algo not in _ALGORITHMS:
+        raise Exception("Please use the valid algorithm. "
+                        + f"({', '.join(_ALGORITHMS)})")
+    dtype = np.dtype(dtype)
+
+    if mmap:
+        return _process_mmap(in_path, out_path, algo, s, block_size, dtype,
+                             kwargs)
+
+    with sf.SoundFile(in_path) as f_in:
+        f_out = sf.SoundFile(out_path, 'w', samplerate=f_in.samplerate,
+                             channels=f_in.channels, subtype=subtype)
+        # a partially written output is removed if the processing fails.
+        try:
+            with f_out:
+                return _process_blocks(f_in, f_out, algo, s, block_size,
+                                       dtype, kwargs)
+        except BaseException:
+            os.remove(out_path)
+            raise
+
+
+def _process_blocks(f_in, f_out, algo, s, block_size, dtype, kwargs):
+    """Stream the input file to the output file, or process it at once
+    if the algorithm has no stream version. See `process_file`.
+
+    Returns
+    -------
+
+    output_length : int >= 0 [scalar]
+                    number of samples written to the output file.
+    """
+    if algo not in _STREAMS or not np.isscalar(s):
+        x = f_in.read(dtype=dtype.name, always_2d=True)
+        y = _ALGORITHMS[algo](x, s, dtype=dtype, channel_axis=-1, **kwargs)
+        f_out.write(y)
+        return y.shape[0]
+
+    # the samples of soundfile are interleaved, with the channels last.
+    stream = _STREAMS[algo](s, n_chan=f_in.channels, length=f_in.frames,
+                            dtype=dtype, channel_axis=-1, **kwargs)
+    output_length = 0
+    for x in f_in.blocks(block_size, dtype=dtype.name, always_2d=True):
+        y = stream.process(x)
+        f_out.write(y)
+        output_length += y.shape[0]
+
+    y = stream.flush()
+    f_out.write(y)
+
+    return output_length + y.shape[0]
+
+
+def _process_mmap(in_path, out_path, algo, s, block_size, dtype, kwargs):
+    """Process the memory-mapped input file into the memory-mapped output
+    file. See `process_file`.
+
+    Returns
+    -------
+
+    output_length : int >= 0 [scalar]
+                    number of samples written to the output file.
+    """
+    if algo not in _MMAP_ALGORITHMS:
+        raise Exception("Please use the valid algorithm for mmap. "
+                        + f"({', '.join(_MMAP_ALGORITHMS)})")
+    if dtype.name not in _MMAP_SUBTYPES:
+        raise Exception("Please use the valid dtype for mmap. "
+                        + "(float32 or float64)")
+
+    info = sf.info(in_path)
+    if info.format not in ('WAV', 'WAVEX', 'RF64') \
+            or info.subtype not in _MMAP_SUBTYPES.values():
+        raise Exception("Please use the valid input file for mmap. "
+                        + "(WAV with FLOAT or DOUBLE subtype)")
+
+    x = _wav_memmap(in_path, 'r')
+    anc_points = _validate_scale_factor(x.T, s)
+    output_length = int(anc_points[-1, -1]) + 1
+
+    # the output file is created with zeros and mapped afterwards.
+    # RF64 is used if the data chunk is too large for WAV.
+    n_bytes = output_length * info.channels * dtype.itemsize
+    with sf.SoundFile(out_path, 'w', samplerate=info.samplerate,
+                      channels=info.channels,
+                      subtype=_MMAP_SUBTYPES[dtype.name],
+                      format='WAV' if n_bytes < 2 ** 32 - 4096 else 'RF64') \
+            as f_out:
+        zeros = np.zeros((min(block_size, output_length), info.channels),
+                         dtype=dtype)
+        for start in range(0, output_length, block_size):
+            f_out.write(zeros[: output_length - start])
+
+    # a partially written output is removed if the processing fails.
+    try:
+        y = _wav_memmap(out_path, 'r+')
+        if algo == 'pv':
+            hop = kwargs.get('syn_hop_size', 512)
+            kwargs.setdefault('block_frames', max(1, block_size // hop))
+        _ALGORITHMS[algo](x, s, dtype=dtype, out=y, channel_axis=-1,
+                          **kwargs)
+        y.flush()
+    except BaseException:
+        os.remove(out_path)
+        raise
+
+    return output_length
+
+
+def _wav_memmap(path, mode):
+    """Memory-map the samples of a WAV or RF64 file of floating points.
+
+    Parameters
+    ----------
+
+    path : str
+           path of the audio file.
+    mode : str
+           the mode of numpy.memmap. 'r' or 'r+'.
+
+    Returns
+    -------
+
+    x : numpy.memmap [shape=(num_samples, channel)]
+        the interleaved samples of the file.
+    """
+    with open(path, 'rb') as f:
+        riff, _, wave = struct.unpack('<4sI4s', f.read(12))
+        if riff not in (b'RIFF', b'RF64') or wave != b'WAVE':
+            raise Exception("Please use the valid WAV file. "
+                            + f"({path})")
+
+        ds64_size = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise Exception("Please use the valid WAV file. "
+                                + f"(no data chunk in {path})")
+            chunk_id, size = struct.unpack('<4sI', header)
+            pos = f.tell()
+
+            if chunk_id == b'ds64':
+                # the 64-bit sizes of RF64. the one of the data chunk is
+                # used instead of its 32-bit size.
+                ds64_size = struct.unpack('<QQ', f.read(16))[1]
+            elif chunk_id == b'fmt ':
+                channels, bits = struct.unpack('<2xH10xH', f.read(16))
+            elif chunk_id == b'data':
+                if riff == b'RF64' and size == 0xFFFFFFFF:
+                    size = ds64_size
+                break
+
+            # the chunks are aligned to 2 bytes.
+            f.seek(pos + size + size % 2)
+
+    dtype = np.dtype(f'<f{bits // 8}')
+    n_samples = size // (dtype.itemsize * channels)
+
+    x = np.memmap(path, dtype=dtype, mode=mode, offset=pos,
+                  shape=(n_samples, channels))
+    return x
+
+
+def _ola_stream(alpha, **kwargs):
+    # OLA is WSOLA with zero tolerance.
+    return WSOLAStream(alpha, tolerance=0, **kwargs)
+
+
+_ALGORITHMS = {'ola': ola, 'wsola': wsola, 'pv': phase_vocoder,
+               'pv_int': phase_vocoder_int, 'hptsm': hptsm}
+_MMAP_ALGORITHMS = ['ola', 'wsola', 'pv']
+_MMAP_SUBTYPES = {'float32': 'FLOAT', 'float64': 'DOUBLE'}
+_STREAMS = {'ola': _ola_stream, 'wsola': WSOLAStream,
+            'pv': PhaseVocoderStream}
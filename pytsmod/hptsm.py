@@ -1,16 +1,81 @@
 from scipy.ndimage import median_filter
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from .pvtsm import phase_vocoder
 from .olatsm import ola
 from .utils import _validate_audio, stft, istft
+from .utils.validate import _to_channel_axis
+from .utils.threads import get_num_threads, _thread_map
+from .utils.profiling import _profiled
 
 
+class HPSeparation:
+    """Harmonic-percussive separation of an audio sequence for `hptsm`,
+    reusable for many stretch factors. Use `hp_separate` to create it.
+
+    Parameters
+    ----------
+
+    harm : numpy.ndarray [shape=(channel, num_samples) or (num_samples)]
+           the separated harmonic audio sequence.
+    perc : numpy.ndarray [shape=(channel, num_samples) or (num_samples)]
+           the separated percussive audio sequence.
+    """
+    def __init__(self, harm, perc):
+        self.harm = harm
+        self.perc = perc
+
+
+@_profiled('hp_separate')
+def hp_separate(x, hp_len_harm=10, hp_len_perc=10, hp_mask_mode='binary',
+                hp_win_type='hann', hp_win_size=1024, hp_hop_size=256,
+                hp_zero_pad=0, hp_fft_shift=False, hp_median_backend='auto',
+                dtype=np.float64, channel_axis=None):
+    """Separate the audio sequence for `hptsm`,
+    so that the separation can be reused for many stretch factors.
+
+    Parameters
+    ----------
+
+    x : numpy.ndarray [shape=(channel, num_samples) or (num_samples)]
+        the input audio sequence to separate.
+    hp_ : parameters for HPSS.
+    dtype : numpy.dtype
+            floating point type of the computation.
+    channel_axis : int or None
+                   the axis of the channels of a 2-D input.
+                   0 for (channel, num_samples), 1 or -1 for
+                   (num_samples, channel) such as the output of soundfile,
+                   which is used through a view without copying.
+                   None guesses it from the shape.
+                   The separation always keeps the channels first.
+
+    Returns
+    -------
+
+    separation : HPSeparation
+                 the separated harmonic and percussive source.
+    """
+    x = _validate_audio(x, channel_axis)
+
+    x_harm, x_perc = _hpss(x, len_harm=hp_len_harm, len_perc=hp_len_perc,
+                           mask_mode=hp_mask_mode, win_type=hp_win_type,
+                           win_size=hp_win_size, hop_size=hp_hop_size,
+                           zero_pad=hp_zero_pad, fft_shift=hp_fft_shift,
+                           median_backend=hp_median_backend, dtype=dtype)
+
+    return HPSeparation(x_harm, x_perc)
+
+
+@_profiled('hptsm')
 def hptsm(x, s, hp_len_harm=10, hp_len_perc=10, hp_mask_mode='binary', hp_win_type='hann',
           hp_win_size=1024, hp_hop_size=256, hp_zero_pad=0, hp_fft_shift=False,
+          hp_median_backend='auto',
           pv_win_type='hann', pv_win_size=2048, pv_syn_hop_size=512,
           pv_zero_pad=0, pv_restore_energy=False, pv_fft_shift=False,
           pv_phase_lock=True, ola_win_type='hann',
-          ola_win_size=256, ola_syn_hop_size=128):
+          ola_win_size=256, ola_syn_hop_size=128, dtype=np.float64,
+          out=None, channel_axis=None):
     """Modify length of the audio sequence using both Phase Vocoder and OLA.
     Apply Phase Vocoder to harmonic signal, and apply OLA to percussive signal.
     For HPSS, median filter based algorithm is used.
@@ -18,8 +83,11 @@ def hptsm(x, s, hp_len_harm=10, hp_len_perc=10, hp_mask_mode='binary', hp_win_ty
     Parameters
     ----------
 
-    x : numpy.ndarray [shape=(channel, num_samples) or (num_samples)]
-        the input audio sequence to modify.
+    x : numpy.ndarray [shape=(channel, num_samples) or (num_samples)] \
+        or HPSeparation
+        the input audio sequence to modify,
+        or its separation from `hp_separate`.
+        The hp_ parameters are not used for a separation.
     s : number > 0 [scalar] or numpy.ndarray [shape=(2, num_points)]
         the time stretching factor. Either a constant value (alpha)
         or an 2 x n array of anchor points which contains the sample points
@@ -28,6 +96,18 @@ def hptsm(x, s, hp_len_harm=10, hp_len_perc=10, hp_mask_mode='binary', hp_win_ty
     hp_ : parameters for HPSS.
     pv_ : parameters for phase vocoder.
     ola_ : parameters for OLA.
+    dtype : numpy.dtype
+            floating point type of the computation.
+            A separation keeps the type it was computed with.
+    out : numpy.ndarray [shape=(channel, num_samples) or (num_samples)]
+          the array to write the output to, with the shape of the output
+          and the dtype of the computation. It can be reused across the calls.
+    channel_axis : int or None
+                   the axis of the channels of a 2-D input and the output.
+                   0 for (channel, num_samples), 1 or -1 for
+                   (num_samples, channel) such as the output of soundfile,
+                   which is used through a view without copying.
+                   None guesses it from the shape.
 
     Returns
     -------
@@ -35,26 +115,44 @@ def hptsm(x, s, hp_len_harm=10, hp_len_perc=10, hp_mask_mode='binary', hp_win_ty
     y : numpy.ndarray [shape=(channel, num_samples) or (num_samples)]
         the modified output audio sequence.
     """
-    x = _validate_audio(x)
+    if isinstance(x, HPSeparation):
+        separation = x
+    else:
+        separation = hp_separate(x, hp_len_harm=hp_len_harm,
+                                 hp_len_perc=hp_len_perc,
+                                 hp_mask_mode=hp_mask_mode,
+                                 hp_win_type=hp_win_type,
+                                 hp_win_size=hp_win_size,
+                                 hp_hop_size=hp_hop_size,
+                                 hp_zero_pad=hp_zero_pad,
+                                 hp_fft_shift=hp_fft_shift,
+                                 hp_median_backend=hp_median_backend,
+                                 dtype=dtype, channel_axis=channel_axis)
 
-    x_harm, x_perc = _hpss(x, len_harm=hp_len_harm, len_perc=hp_len_perc, mask_mode=hp_mask_mode,
-                           win_type=hp_win_type, win_size=hp_win_size, hop_size=hp_hop_size,
-                           zero_pad=hp_zero_pad, fft_shift=hp_fft_shift)
+    # the separation has the channels first, so does the output
+    # until it is returned.
+    y = None if out is None else _to_channel_axis(out, channel_axis)
 
-    y_harm = phase_vocoder(x_harm, s, win_type=pv_win_type,
+    y_harm = phase_vocoder(separation.harm, s, win_type=pv_win_type,
                            win_size=pv_win_size, syn_hop_size=pv_syn_hop_size,
                            zero_pad=pv_zero_pad,
                            restore_energy=pv_restore_energy,
-                           fft_shift=pv_fft_shift,
-                           phase_lock=pv_phase_lock)
-    y_perc = ola(x_perc, s, win_type=ola_win_type, win_size=ola_win_size,
-                 syn_hop_size=ola_syn_hop_size)
+                           fft_shift=pv_fft_shift, phase_lock=pv_phase_lock,
+                           dtype=separation.harm.dtype, out=y, channel_axis=0)
+    y_perc = ola(separation.perc, s, win_type=ola_win_type,
+                 win_size=ola_win_size, syn_hop_size=ola_syn_hop_size,
+                 dtype=separation.perc.dtype,
+                 channel_axis=0)
+
+    # the percussive part is added to the output of the phase vocoder.
+    y_harm += y_perc
 
-    return y_harm + y_perc
+    return _to_channel_axis(y_harm, channel_axis) if out is None else out
 
 
 def _hpss(x, len_harm=10, len_perc=10, mask_mode='binary', win_type='hann',
-          win_size=1024, hop_size=256, zero_pad=0, fft_shift=False):
+          win_size=1024, hop_size=256, zero_pad=0, fft_shift=False,
+          median_backend='auto', dtype=np.float64):
     """Separate the input audio sequence to a harmonic and a percussive source.
     The algorithm is from the following paper.
 
@@ -81,6 +179,15 @@ def _hpss(x, len_harm=10, len_perc=10, mask_mode='binary', win_type='hann',
                the size of the zero pad in the window function.
     fft_shift : bool
                 apply circular shift to STFT and ISTFT.
+    median_backend : str
+                     implementation of the median filter.
+                     scipy uses scipy.ndimage.median_filter,
+                     and numpy sorts partially every window at once,
+                     which is faster for kernels longer than a few bins.
+                     auto chooses one by the kernel size.
+                     Both give the same result.
+    dtype : numpy.dtype
+            floating point type of the computation.
 
     Returns
     -------
@@ -90,32 +197,133 @@ def _hpss(x, len_harm=10, len_perc=10, mask_mode='binary', win_type='hann',
     x_perc : numpy.ndarray [shape=(channel, num_samples) or (num_samples)]
              the separated percussive audio sequence.
     """
-    x_harm = np.zeros(x.shape)
-    x_perc = np.zeros(x.shape)
-
-    for c, x_chan in enumerate(x):
-        spec = stft(x_chan, ana_hop=hop_size, win_type=win_type, win_size=win_size,
-                    zero_pad=zero_pad, fft_shift=fft_shift)
-        mag_spec = np.abs(spec)
-
-        mag_spec_harm = median_filter(mag_spec, size=[1, len_harm], mode='reflect')
-        mag_spec_perc = median_filter(mag_spec, size=[len_perc, 1], mode='reflect')
-
-        if mask_mode == 'binary':
-            mask_harm = mag_spec_harm > mag_spec_perc
-            mask_perc = mag_spec_harm <= mag_spec_perc
-        elif mask_mode == 'relative':
-            mask_harm = mag_spec_harm / (mag_spec_harm + mag_spec_perc + np.finfo(float).eps)
-            mask_perc = mag_spec_perc / (mag_spec_harm + mag_spec_perc + np.finfo(float).eps)
-        else:
-            raise Exception("Please use the valid mask mode. (binary, relative)")
-
-        spec_harm = mask_harm * spec
-        spec_perc = mask_perc * spec
-
-        x_harm[c, :] = istft(spec_harm, syn_hop=hop_size, win_type=win_type, win_size=win_size,
-                             zero_pad=zero_pad, original_length=x.shape[1], fft_shift=fft_shift)
-        x_perc[c, :] = istft(spec_perc, syn_hop=hop_size, win_type=win_type, win_size=win_size,
-                             zero_pad=zero_pad, original_length=x.shape[1], fft_shift=fft_shift)
+    # analyze all channels at once.
+    spec = stft(x, ana_hop=hop_size, win_type=win_type, win_size=win_size,
+                zero_pad=zero_pad, fft_shift=fft_shift, dtype=dtype)
+    mask_harm, mask_perc = _hp_masks(spec, len_harm, len_perc, mask_mode,
+                                     median_backend)
+
+    spec_harm = mask_harm * spec
+    spec_perc = mask_perc * spec
+
+    # the harmonic and percussive parts are synthesized in parallel.
+    x_harm, x_perc = _thread_map(
+        lambda spec: istft(spec, syn_hop=hop_size, win_type=win_type,
+                           win_size=win_size, zero_pad=zero_pad,
+                           original_length=x.shape[-1], fft_shift=fft_shift),
+        [spec_harm, spec_perc])
 
     return x_harm.squeeze(), x_perc.squeeze()
+
+
+def _hp_masks(spec, len_harm, len_perc, mask_mode, median_backend='auto'):
+    """Compute the harmonic and percussive masks of the spectrogram.
+
+    Parameters
+    ----------
+
+    spec : numpy.ndarray [shape=(channel, num_bins, num_frames)]
+           the STFT of the audio sequence.
+    len_harm : int
+               length of the median filter kernel size for the harmonic source.
+    len_perc : int
+               length of the median filter kernel size for the percussive source.
+    mask_mode : str
+                mask mode for the separation. binary and relative are available.
+    median_backend : str
+                     implementation of the median filter.
+                     auto, scipy and numpy are available.
+
+    Returns
+    -------
+
+    mask_harm : numpy.ndarray [shape=(channel, num_bins, num_frames)]
+                the mask of the harmonic source.
+    mask_perc : numpy.ndarray [shape=(channel, num_bins, num_frames)]
+                the mask of the percussive source.
+    """
+    mag_spec = np.abs(spec)
+
+    # filter along the time and frequency axis.
+    mag_spec_harm = _median_filter(mag_spec, len_harm, -1, median_backend)
+    mag_spec_perc = _median_filter(mag_spec, len_perc, -2, median_backend)
+
+    eps = np.finfo(mag_spec.dtype).eps
+    if mask_mode == 'binary':
+        mask_harm = mag_spec_harm > mag_spec_perc
+        mask_perc = mag_spec_harm <= mag_spec_perc
+    elif mask_mode == 'relative':
+        mask_harm = mag_spec_harm / (mag_spec_harm + mag_spec_perc + eps)
+        mask_perc = mag_spec_perc / (mag_spec_harm + mag_spec_perc + eps)
+    else:
+        raise Exception("Please use the valid mask mode. (binary, relative)")
+
+    return mask_harm, mask_perc
+
+
+@_profiled('median_filter')
+def _median_filter(x, size, axis, backend='auto'):
+    """Median filter along one axis, same as scipy.ndimage.median_filter
+    with mode='reflect'. For an even size, the upper median is used.
+
+    Parameters
+    ----------
+
+    x : numpy.ndarray
+        the input array to filter.
+    size : int > 0 [scalar]
+           length of the median filter kernel.
+    axis : int
+           the axis to filter along.
+    backend : str
+              implementation of the median filter.
+              auto, scipy and numpy are available.
+
+    Returns
+    -------
+
+    y : numpy.ndarray [shape=x.shape]
+        the filtered array.
+    """
+    if backend == 'auto':
+        backend = 'numpy' if size >= 8 else 'scipy'
+
+    if backend not in ('scipy', 'numpy'):
+        raise Exception("Please use the valid median backend. "
+                        + "(auto, scipy, numpy)")
+
+    # filter along the last axis, so that every window is contiguous.
+    # the rows are filtered independently, a few rows at a time
+    # to bound the memory, and the blocks are run in the thread pool.
+    x = np.moveaxis(x, axis, -1)
+    shape = x.shape
+    x = x.reshape(-1, shape[-1])
+    y = np.empty_like(x)
+
+    # np.pad repeats the reflection differently from scipy.ndimage
+    # for a kernel longer than the axis.
+    if size > shape[-1]:
+        backend = 'scipy'
+
+    if backend == 'scipy':
+        num_rows = -(-x.shape[0] // get_num_threads())
+    else:
+        num_rows = max(1, 2 ** 22 // (shape[-1] * size))
+
+    def filter_rows(i):
+        if backend == 'scipy':
+            y[i: i + num_rows] = median_filter(x[i: i + num_rows],
+                                               size=(1, size), mode='reflect')
+            return
+
+        # 'symmetric' of np.pad is 'reflect' of scipy.ndimage.
+        x_padded = np.pad(x[i: i + num_rows],
+                          ((0, 0), (size // 2, size - size // 2 - 1)),
+                          'symmetric')
+        frames = sliding_window_view(x_padded, size, axis=-1)
+        y[i: i + num_rows] = np.partition(frames, size // 2,
+                                          axis=-1)[..., size // 2]
+
+    _thread_map(filter_rows, range(0, x.shape[0], num_rows))
+
+    return np.moveaxis(y.reshape(shape), -1, axis)
@@ -1,7 +1,11 @@
+import numpy as np
 from .wsolatsm import wsola
+from .utils.profiling import _profiled
 
 
-def ola(x, s, win_type='hann', win_size=1024, syn_hop_size=512):
+@_profiled('ola')
+def ola(x, s, win_type='hann', win_size=1024, syn_hop_size=512,
+        dtype=np.float64, out=None, channel_axis=None):
     """Modify length of the audio sequence using OLA algorithm.
     WSOLA with zero tolerance is working same as OLA.
 
@@ -22,6 +26,17 @@ def ola(x, s, win_type='hann', win_size=1024, syn_hop_size=512):
     syn_hop_size : int > 0 [scalar]
                    hop size of the synthesis window.
                    Usually half of the window size.
+    dtype : numpy.dtype
+            floating point type of the computation.
+    out : numpy.ndarray [shape=(channel, num_samples) or (num_samples)]
+          the array to write the output to, with the shape of the output
+          and the given dtype. It can be reused across the calls.
+    channel_axis : int or None
+                   the axis of the channels of a 2-D input and the output.
+                   0 for (channel, num_samples), 1 or -1 for
+                   (num_samples, channel) such as the output of soundfile,
+                   which is used through a view without copying.
+                   None guesses it from the shape.
 
      Returns
      -------
@@ -30,4 +45,5 @@ def ola(x, s, win_type='hann', win_size=1024, syn_hop_size=512):
          the modified output audio sequence.
     """
     return wsola(x, s, win_type=win_type, win_size=win_size,
-                 syn_hop_size=syn_hop_size, tolerance=0)
+                 syn_hop_size=syn_hop_size, tolerance=0, dtype=dtype, out=out,
+                 channel_axis=channel_axis)
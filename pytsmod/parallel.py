@@ -0,0 +1,271 @@
+import os
+import functools
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import numpy as np
+from scipy.interpolate import interp1d
+from .wsolatsm import wsola
+from .olatsm import ola
+from .pvtsm import phase_vocoder
+from .hptsm import hptsm
+from .utils import _validate_audio, _validate_scale_factor
+from .utils.validate import _validate_out, _to_channel_axis
+
+
+ALGORITHMS = {'ola': ola, 'wsola': wsola, 'pv': phase_vocoder,
+              'hptsm': hptsm}
+
+
+def process(x, s, algo='wsola', n_jobs=None, chunk_seconds=30, sr=44100,
+            overlap_seconds=0.25, crossfade_seconds=0.05, backend='thread',
+            out=None, channel_axis=None, **kwargs):
+    """Modify length of a long audio sequence by processing chunks in parallel.
+
+    The input is split into chunks, each extended by an overlap on both sides.
+    Each chunk is modified with the anchor points of the whole signal
+    restricted to it, so that the chunks are placed at the same output
+    positions as in the unchunked result. The chunks start on the grid of
+    the synthesis windows, so that the windows are also at the same positions.
+    Adjacent chunks are crossfaded at the seams,
+    and the output has the same length as the unchunked result.
+    The crossfade keeps the energy of the seam from the correlation
+    of the chunks there: it is an equal-power crossfade for uncorrelated
+    chunks, such as the ones of wsola and pv whose phases differ,
+    and a linear one for identical chunks, such as the ones of ola.
+
+    Parameters
+    ----------
+
+    x : numpy.ndarray [shape=(channel, num_samples) or (num_samples)]
+        the input audio sequence to modify.
+    s : number > 0 [scalar] or numpy.ndarray [shape=(2, num_points)]
+        the time stretching factor. Either a constant value (alpha)
+        or an 2 x n array of anchor points which contains the sample points
+        of the input signal in the first row
+        and the sample points of the output signal in the second row.
+    algo : str or callable
+           the TSM algorithm. ola, wsola, pv and hptsm are available,
+           or a function called as algo(x, s, **kwargs).
+    n_jobs : int > 0 [scalar] or None
+             number of workers. None uses the number of CPUs.
+    chunk_seconds : number > 0 [scalar]
+                    length of the chunks in the input (in seconds).
+    sr : int > 0 [scalar]
+         sample rate of the input audio sequence.
+    overlap_seconds : number > 0 [scalar]
+                      length of the input added to both sides of each chunk
+                      (in seconds). It should be longer than
+                      the window of the algorithm.
+    crossfade_seconds : number > 0 [scalar]
+                        length of the crossfade at the seams
+                        (in seconds of the output).
+                        It is shortened if the overlap is too short.
+    backend : str
+              thread or process. Threads share the input without copying,
+              and the FFTs of numpy and scipy release the GIL.
+              Processes also run the Python loops in parallel,
+              but the chunks are copied to the workers.
+              The search loop of wsola holds the GIL,
+              so it gains little from threads and should use processes.
+    out : numpy.ndarray [shape=(channel, num_samples) or (num_samples)]
+          the array to write the output to, with the shape of the output
+          and the dtype of the computation.
+    channel_axis : int or None
+                   the axis of the channels of a 2-D input and the output.
+                   0 for (channel, num_samples), 1 or -1 for
+                   (num_samples, channel) such as the output of soundfile.
+                   The chunks are views of the input with the channels first.
+                   None guesses it from the shape.
+    kwargs : the parameters of the algorithm.
+
+    Returns
+    -------
+
+    y : numpy.ndarray [shape=(channel, num_samples) or (num_samples)]
+        the modified output audio sequence.
+    """
+    if isinstance(algo, str):
+        if algo not in ALGORITHMS:
+            raise Exception("Please use the valid algorithm. "
+                            + f"({', '.join(ALGORITHMS)})")
+        # the chunks are given with the channels first.
+        algo = functools.partial(ALGORITHMS[algo], channel_axis=0)
+    if backend == 'thread':
+        executor = ThreadPoolExecutor
+    elif backend == 'process':
+        executor = ProcessPoolExecutor
+    else:
+        raise Exception("Please use the valid backend. (thread or process)")
+
+    x = _validate_audio(x, channel_axis)
+    anc_points = _validate_scale_factor(x, s)
+    n_chan, length = x.shape
+    output_length = int(anc_points[-1, -1]) + 1
+
+    # the synthesis hop of hptsm is the one of the phase vocoder,
+    # which is a multiple of the one of OLA by default.
+    grid = kwargs.get('syn_hop_size', kwargs.get('pv_syn_hop_size', 512))
+
+    bounds, chunk_anc, starts, ends, seams, fades = _chunk_layout(
+        anc_points, length, output_length, int(chunk_seconds * sr),
+        int(overlap_seconds * sr), int(crossfade_seconds * sr) // 2, grid)
+
+    if len(bounds) == 1:
+        if out is not None:
+            kwargs['out'] = _to_channel_axis(out, channel_axis)
+        y = algo(x, s, **kwargs)
+        return _to_channel_axis(y, channel_axis) if out is None else out
+
+    dtype = kwargs.get('dtype', np.float64)
+    y = _validate_out(out, n_chan, output_length, dtype, channel_axis)
+    y.fill(0)
+
+    n_jobs = os.cpu_count() if n_jobs is None else n_jobs
+    with executor(max_workers=n_jobs) as pool:
+        futures = [pool.submit(algo, x[:, lo: hi], anc, **kwargs)
+                   for (lo, hi), anc in zip(bounds, chunk_anc)]
+
+        # each chunk is added as soon as it is done, and its end is kept
+        # until it is crossfaded with the next chunk,
+        # so only the unfinished chunks are kept.
+        tail = None
+        for k, future in enumerate(futures):
+            y_chunk = future.result().reshape(n_chan, -1)
+            if y_chunk.shape[-1] != ends[k] - starts[k]:
+                raise Exception("Please use the valid algorithm. "
+                                + "(the output length of a chunk "
+                                + "does not follow the anchor points)")
+
+            lo = seams[k] - fades[k]
+            mid = seams[k] + fades[k]
+            hi = seams[k+1] - fades[k+1]
+            head = y_chunk[:, lo - starts[k]: mid - starts[k]]
+            if fades[k]:
+                fade_in, fade_out = _crossfade(tail, head, y.dtype)
+                y[:, lo: mid] += tail * fade_out + head * fade_in
+            y[:, mid: hi] += y_chunk[:, mid - starts[k]: hi - starts[k]]
+            tail = y_chunk[:, hi - starts[k]: hi + 2 * fades[k+1]
+                           - starts[k]].copy()
+            futures[k] = None
+
+    if out is None:
+        return _to_channel_axis(y.squeeze(), channel_axis)
+    return out
+
+
+def _chunk_layout(anc_points, length, output_length, chunk_size, overlap,
+                  fade, grid):
+    """Split the input into overlapping chunks and place them in the output.
+
+    Parameters
+    ----------
+
+    anc_points : numpy.ndarray [shape=(2, num_points)]
+                 anchor points of the whole input.
+    length : int > 0 [scalar]
+             length of the input.
+    output_length : int > 0 [scalar]
+                    length of the output.
+    chunk_size : int > 0 [scalar]
+                 length of the chunks in the input.
+    overlap : int >= 0 [scalar]
+              length of the input added to both sides of each chunk.
+    fade : int >= 0 [scalar]
+           half length of the crossfade at the seams in the output.
+    grid : int > 0 [scalar]
+           the output of each chunk starts at a multiple of grid.
+
+    Returns
+    -------
+
+    bounds : numpy.ndarray [shape=(num_chunks, 2)]
+             start and end of each chunk with the overlap in the input.
+    chunk_anc : list of numpy.ndarray [shape=(2, num_points)]
+                anchor points of each chunk, relative to the start
+                of the chunk in the input and in the output.
+    starts : numpy.ndarray [shape=(num_chunks)]
+             output position of the first sample of each chunk.
+    ends : numpy.ndarray [shape=(num_chunks)]
+           output position after the last sample of each chunk.
+    seams : numpy.ndarray [shape=(num_chunks + 1)]
+            output positions where the chunks are joined,
+            with 0 and output_length at both ends.
+    fades : numpy.ndarray [shape=(num_chunks + 1)]
+            half length of the crossfade at each seam.
+    """
+    out_pos = interp1d(anc_points[0], anc_points[1], fill_value='extrapolate')
+
+    n_chunks = max(1, int(round(length / max(chunk_size, 1))))
+    splits = np.arange(n_chunks + 1) * length // n_chunks
+
+    bounds = np.stack([np.maximum(splits[:-1] - overlap, 0),
+                       np.minimum(splits[1:] + overlap, length)]).T
+
+    # the output of a chunk starting at the first sample is not shifted,
+    # so that it starts at 0 as the unchunked result.
+    starts = np.floor(out_pos(bounds[:, 0]) / grid) * grid
+    starts = np.where(bounds[:, 0] > 0, np.maximum(starts, 0), 0).astype(int)
+
+    # the anchor points inside the chunk, and the interpolated ones
+    # at its edges unless an anchor point is already there.
+    chunk_anc = []
+    for (lo, hi), start in zip(bounds, starts):
+        inner = (anc_points[0] >= lo) & (anc_points[0] <= hi - 1)
+        anc = anc_points[:, inner]
+        if not anc.size or anc[0, 0] > lo:
+            anc = np.hstack([[[lo], [out_pos(lo)]], anc])
+        if anc[0, -1] < hi - 1:
+            anc = np.hstack([anc, [[hi - 1], [out_pos(hi - 1)]]])
+        chunk_anc.append(anc - [[lo], [start]])
+
+    # the output length of the algorithms follows the last anchor point.
+    ends = starts + np.array([int(anc[1, -1]) + 1 for anc in chunk_anc])
+
+    seams = np.round(out_pos(splits)).astype(int)
+    seams[0], seams[-1] = 0, output_length
+    seams = np.clip(seams, 0, output_length)
+
+    # the crossfade stays in the middle of the overlap,
+    # away from the edges of the chunks.
+    fades = np.zeros(n_chunks + 1, dtype=int)
+    margin = np.minimum(seams[1:-1] - starts[1:], ends[:-1] - seams[1:-1])
+    fades[1:-1] = np.clip(np.minimum(fade, margin // 2), 0, None)
+
+    return bounds, chunk_anc, starts, ends, seams, fades
+
+
+def _crossfade(tail, head, dtype):
+    """Compute the gains of the crossfade between two chunks,
+    so that the energy is kept for their correlation.
+    The gains are split into an odd part, which is linear,
+    and an even part, which keeps the energy.
+
+    Parameters
+    ----------
+
+    tail : numpy.ndarray [shape=(channel, num_samples)]
+           the end of the previous chunk, faded out.
+    head : numpy.ndarray [shape=(channel, num_samples)]
+           the start of the next chunk, faded in.
+    dtype : numpy.dtype
+            floating point type of the gains.
+
+    Returns
+    -------
+
+    fade_in : numpy.ndarray [shape=(num_samples)]
+              the gain of the next chunk.
+    fade_out : numpy.ndarray [shape=(num_samples)]
+               the gain of the previous chunk.
+    """
+    energy = np.sqrt(np.sum(tail ** 2) * np.sum(head ** 2))
+    corr = np.sum(tail * head) / energy if energy > 0 else 1.
+    # a negative correlation is crossfaded as an uncorrelated one.
+    corr = np.clip(corr, 0, 1)
+
+    # odd and even parts of the gains, with fade_in ** 2 + fade_out ** 2
+    # + 2 * corr * fade_in * fade_out = 1.
+    odd = (np.arange(tail.shape[-1]) + 0.5) / tail.shape[-1] - 0.5
+    even = np.sqrt(0.5 / (1 + corr) - (1 - corr) / (1 + corr) * odd ** 2)
+
+    return (even + odd).astype(dtype), (even - odd).astype(dtype)
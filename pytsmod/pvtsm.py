@@ -1,11 +1,19 @@
 import numpy as np
 from scipy.interpolate import interp1d
 from .utils import stft, istft, _validate_audio, _validate_scale_factor
+from .utils.validate import _validate_out, _to_channel_axis
+from .utils import win as win_func
+from .utils.win import _squared_win
+from .utils.stft import _frames, _analyze_frames, _synthesize_frames
+from .utils.stft import _overlap_add, _window_sum
+from .utils.profiling import _stage, _profiled
 
 
+@_profiled('phase_vocoder')
 def phase_vocoder(x, s, win_type='sin', win_size=2048, syn_hop_size=512,
                   zero_pad=0, restore_energy=False, fft_shift=False,
-                  phase_lock=False):
+                  phase_lock=False, channel_link=None, dtype=np.float64,
+                  out=None, block_frames=None, channel_axis=None):
     """Modify length of the audio sequence using Phase Vocoder algorithm.
 
     Parameters
@@ -34,6 +42,39 @@ def phase_vocoder(x, s, win_type='sin', win_size=2048, syn_hop_size=512,
                 apply circular shift to STFT and ISTFT.
     phase_lock : bool
                  apply phase locking.
+    channel_link : str or None
+                   share the phase propagation across the channels.
+                   The instantaneous frequency and the peaks are computed
+                   once from a reference spectrum, and the resulting phasor
+                   is applied to every channel.
+                   'mid' uses the average spectrum of the channels.
+                   'sum' uses the summed magnitude of the channels
+                   with the phase of the average spectrum, so that peaks
+                   are not cancelled by phase differences between channels.
+                   Both modes share the phase of the average spectrum,
+                   so they only differ in the peaks used for phase locking.
+                   None processes each channel independently.
+    dtype : numpy.dtype
+            floating point type of the computation.
+            numpy.float32 processes the spectrogram in numpy.complex64.
+    out : numpy.ndarray [shape=(channel, num_samples) or (num_samples)]
+          the array to write the output to, with the shape of the output
+          and the given dtype. It can be reused across the calls.
+    block_frames : int > 0 [scalar] or None
+                   number of frames analyzed and synthesized at once.
+                   The phase propagation continues across the blocks,
+                   and the output is normalized as soon as
+                   no later frame overlaps it, so the memory usage
+                   is bounded by the block instead of the whole spectrogram.
+                   With numpy.memmap as the input and out,
+                   inputs larger than the memory can be processed.
+                   None processes all frames at once.
+    channel_axis : int or None
+                   the axis of the channels of a 2-D input and the output.
+                   0 for (channel, num_samples), 1 or -1 for
+                   (num_samples, channel) such as the output of soundfile,
+                   which is used through a view without copying.
+                   None guesses it from the shape.
 
     Returns
     -------
@@ -42,11 +83,12 @@ def phase_vocoder(x, s, win_type='sin', win_size=2048, syn_hop_size=512,
         the modified output audio sequence.
     """
     # validate the input audio and scale factor.
-    x = _validate_audio(x)
+    x = _validate_audio(x, channel_axis)
     anc_points = _validate_scale_factor(x, s)
 
-    n_chan = x.shape[0]
     output_length = int(anc_points[-1, -1]) + 1
+    y = _validate_out(out, x.shape[0], output_length, dtype, channel_axis)
+    y.fill(0)
 
     sw_pos = np.arange(0, output_length + win_size // 2, syn_hop_size)
     ana_interpolated = interp1d(anc_points[1, :], anc_points[0, :],
@@ -54,61 +96,73 @@ def phase_vocoder(x, s, win_type='sin', win_size=2048, syn_hop_size=512,
     aw_pos = np.round(ana_interpolated(sw_pos)).astype(int)
     ana_hop = np.insert(aw_pos[1:] - aw_pos[0: -1], 0, 0)
 
-    y = np.zeros((n_chan, output_length))
-
-    for c, x_chan in enumerate(x):
-        X = stft(x_chan, ana_hop=aw_pos, win_type=win_type,
-                 win_size=win_size, zero_pad=zero_pad, fft_shift=fft_shift)
-
-        Y = np.zeros(X.shape, dtype=np.complex128)
-        Y[:, 0] = X[:, 0]  # phase initialization
-
-        N = win_size + zero_pad
-        k = np.arange(N / 2 + 1)
-
-        omega = 2 * np.pi * k / N
-
-        for i in range(1, X.shape[1]):
-            dphi = omega * ana_hop[i]
-
-            ph_curr = np.angle(X[:, i])
-            ph_last = np.angle(X[:, i - 1])
-
-            hpi = (ph_curr - ph_last) - dphi
-            hpi = hpi - 2 * np.pi * np.round(hpi / (2 * np.pi))
-
-            ipa_sample = (omega + hpi / ana_hop[i])
-
-            ipa_hop = ipa_sample * syn_hop_size
-
-            ph_syn = np.angle(Y[:, i - 1])
-
-            if phase_lock:
-                p, ir = _find_peaks(X[:, i])
-
-                theta = np.zeros(Y[:, i].shape)
-                for n in range(len(p)):
-                    theta[ir[0, n]: ir[1, n] + 1] = ph_syn[p[n]] + ipa_hop[p[n]] - ph_curr[p[n]]
-
-                phasor = np.exp(1j * theta)
-            else:
-                theta = ph_syn + ipa_hop - ph_curr
-                phasor = np.exp(1j * theta)
-
-            Y[:, i] = phasor * X[:, i]
-
-        y_chan = istft(Y, syn_hop=syn_hop_size, win_type=win_type,
-                       win_size=win_size, zero_pad=zero_pad, num_iter=1,
-                       original_length=output_length, fft_shift=fft_shift,
-                       restore_energy=restore_energy)
-
-        y[c, :] = y_chan
-
-    return y.squeeze()
-
-
+    w = win_func(win_type, win_size, zero_pad, dtype=dtype)
+    w_sq = _squared_win(win_type, win_size, zero_pad, dtype)
+    win_len = w.size
+    n_frames = aw_pos.size
+    if block_frames is None:
+        block_frames = n_frames
+
+    # the output of the ISTFT stops at the center of the last frame.
+    length = min(output_length, (n_frames - 1) * syn_hop_size)
+
+    # analyze all channels at once, a block of frames at a time.
+    # the frames are overlap-added to the output, which is normalized
+    # up to the first frame of the next block.
+    state = None
+    done = 0
+    for first in range(0, n_frames, block_frames):
+        last = min(first + block_frames, n_frames)
+
+        X = stft(x, ana_hop=aw_pos[first: last], win_type=win_type,
+                 win_size=win_size, zero_pad=zero_pad, fft_shift=fft_shift,
+                 dtype=dtype)
+
+        X_ref = _link_channels(X, channel_link)
+        with _stage('phase_propagation', last - first):
+            Y, state = _propagate_phase(X, X_ref, ana_hop[first: last],
+                                        syn_hop_size, win_size + zero_pad,
+                                        phase_lock, state)
+
+        with _stage('istft', last - first):
+            xiw = _synthesize_frames(np.swapaxes(Y, -1, -2), w, fft_shift,
+                                     restore_energy)
+            _add_to_output(y, _overlap_add(xiw, syn_hop_size),
+                           first * syn_hop_size - win_len // 2, length)
+
+        end = last * syn_hop_size
+        if last == n_frames:
+            end = (n_frames - 1) * syn_hop_size + win_len
+        ow = _window_sum(w_sq, syn_hop_size, n_frames, done, end)
+        ow[ow < 1e-3] = 1
+        _divide_output(y, ow, done - win_len // 2, length)
+        done = end
+
+    if out is None:
+        return _to_channel_axis(y.squeeze(), channel_axis)
+    return out
+
+
+def _add_to_output(y, seg, pos, length):
+    # add the segment starting at pos to the output, cut at its edges.
+    lo = max(pos, 0)
+    hi = min(pos + seg.shape[-1], length)
+    if hi > lo:
+        y[:, lo: hi] += seg[:, lo - pos: hi - pos]
+
+
+def _divide_output(y, ow, pos, length):
+    # divide the output from pos by the window sum, cut at its edges.
+    lo = max(pos, 0)
+    hi = min(pos + ow.size, length)
+    if hi > lo:
+        y[:, lo: hi] /= ow[lo - pos: hi - pos]
+
+
+@_profiled('phase_vocoder_int')
 def phase_vocoder_int(x, s, win_type='hann', win_size=2048, syn_hop_size=512,
-                      zero_pad=None, restore_energy=False, fft_shift=True):
+                      zero_pad=None, restore_energy=False, fft_shift=True,
+                      dtype=np.float64, channel_axis=None):
     """Modify length of the audio sequence using Phase Vocoder algorithm.
     Works specially well for integer stretching.
 
@@ -133,6 +187,15 @@ def phase_vocoder_int(x, s, win_type='hann', win_size=2048, syn_hop_size=512,
                      tries to reserve potential energy loss.
     fft_shift : bool
                 apply circular shift to STFT and ISTFT.
+    dtype : numpy.dtype
+            floating point type of the computation.
+            numpy.float32 processes the spectrogram in numpy.complex64.
+    channel_axis : int or None
+                   the axis of the channels of a 2-D input and the output.
+                   0 for (channel, num_samples), 1 or -1 for
+                   (num_samples, channel) such as the output of soundfile,
+                   which is used through a view without copying.
+                   None guesses it from the shape.
 
     Returns
     -------
@@ -141,7 +204,7 @@ def phase_vocoder_int(x, s, win_type='hann', win_size=2048, syn_hop_size=512,
         the modified output audio sequence.
     """
     # validate the input audio and scale factor.
-    x = _validate_audio(x)
+    x = _validate_audio(x, channel_axis)
     if np.isscalar(s) and isinstance(s, int) and s >= 1:
         anchor_points = np.array([[0, np.shape(x)[1] - 1],
                                   [0, np.ceil(s * np.shape(x)[1]) - 1]])
@@ -157,60 +220,653 @@ def phase_vocoder_int(x, s, win_type='hann', win_size=2048, syn_hop_size=512,
     out_win_pos = np.arange(0, output_length + win_size // 2, syn_hop_size)
     in_win_pos = ((out_win_pos - 1) / s + 1).astype(int)
 
-    n_channels = x.shape[0]
-    y = np.zeros((n_channels, output_length))
+    X = stft(x, ana_hop=in_win_pos, win_type=win_type,
+             win_size=win_size, zero_pad=zero_pad, fft_shift=fft_shift,
+             dtype=dtype)
+    Y = abs(X) * np.exp(1j * s * np.angle(X))
 
-    for c, x_chan in enumerate(x):
-        X = stft(x_chan, ana_hop=in_win_pos, win_type=win_type,
-                 win_size=win_size, zero_pad=zero_pad, fft_shift=fft_shift)
-        Y = abs(X) * np.exp(1j * s * np.angle(X))
+    y = istft(Y, syn_hop=syn_hop_size, win_type=win_type,
+              win_size=win_size, zero_pad=zero_pad, num_iter=1,
+              original_length=output_length,
+              restore_energy=restore_energy, fft_shift=fft_shift)
 
-        y_chan = istft(Y, syn_hop=syn_hop_size, win_type=win_type,
-                       win_size=win_size, zero_pad=zero_pad, num_iter=1,
-                       original_length=output_length,
-                       restore_energy=restore_energy, fft_shift=fft_shift)
+    return _to_channel_axis(y.squeeze(), channel_axis)
 
-        y[c, :] = y_chan
 
-    return y.squeeze()
+class PhaseVocoderStream:
+    """Stream version of phase vocoder for a constant time stretching factor.
+    The input is given block by block with `process`,
+    and the remaining output is returned by `flush` at the end of the input.
+    Only the phase of the previous frame and the overlap-add tail are kept,
+    so the memory usage does not depend on the length of the input.
 
+    Parameters
+    ----------
 
-def _find_peaks(spec):
-    """ Find indices of peaks in spectrogram.
-    A value which it the largest value among its four nearest neighbors
-    is treated as a peak.
+    alpha : number > 0 [scalar]
+            the time stretching factor.
+    n_chan : int > 0 [scalar]
+             number of channels of the input audio sequence.
+    win_type : str
+               type of the window function for the STFT.
+               hann and sin are available.
+    win_size : int > 0 [scalar]
+               size of the window function.
+    syn_hop_size : int > 0 [scalar]
+                   hop size of the synthesis window.
+                   Usually half of the window size.
+    zero_pad : int > 0 [scalar]
+               the size of the zero pad in the window function.
+    restore_energy : bool
+                     tries to reserve potential energy loss.
+    fft_shift : bool
+                apply circular shift to STFT and ISTFT.
+    phase_lock : bool
+                 apply phase locking.
+    channel_link : str or None
+                   share the phase propagation across the channels.
+                   See `phase_vocoder` for the details.
+    length : int > 0 [scalar] or None
+             total number of samples of the input, if known.
+             When it is given, the output is the same as
+             `phase_vocoder(x, alpha)` of the whole input.
+             Otherwise, the window positions follow 1 / alpha exactly.
+    dtype : numpy.dtype
+            floating point type of the computation.
+            numpy.float32 processes the spectrogram in numpy.complex64.
+    channel_axis : int
+                   the axis of the channels of the blocks and the output.
+                   0 for (channel, num_samples), 1 or -1 for
+                   (num_samples, channel) such as the blocks of soundfile.
+
+    Attributes
+    ----------
+
+    latency : int >= 0 [scalar]
+              maximum number of output samples held back by the stream.
+              After n input samples are processed,
+              at least ceil(alpha * n) - latency output samples
+              have been returned.
+    """
+    def __init__(self, alpha, n_chan=1, win_type='sin', win_size=2048,
+                 syn_hop_size=512, zero_pad=0, restore_energy=False,
+                 fft_shift=False, phase_lock=False, channel_link=None,
+                 length=None, dtype=np.float64, channel_axis=0):
+        if channel_axis not in (0, 1, -1):
+            raise Exception("Please use the valid channel axis. (0, 1 or -1)")
+        if length is None:
+            anc_points = np.array([[0, 1], [0, alpha]])
+        else:
+            anc_points = np.array([[0, length - 1],
+                                   [0, np.ceil(alpha * length) - 1]])
+
+        self.alpha = alpha
+        self.n_chan = n_chan
+        self.win_size = win_size
+        self.syn_hop_size = syn_hop_size
+        self.zero_pad = zero_pad
+        self.restore_energy = restore_energy
+        self.fft_shift = fft_shift
+        self.phase_lock = phase_lock
+        self.channel_link = channel_link
+        self.length = length
+        self.dtype = np.dtype(dtype)
+        self.channel_axis = channel_axis
+
+        self._win = win_func(win_type=win_type, win_size=win_size,
+                             zero_pad=zero_pad, dtype=self.dtype)
+        self._win_sq = _squared_win(win_type, win_size, zero_pad, self.dtype)
+        win_len = self._win.size
+        self.latency = int(np.ceil(alpha * (win_len - win_len // 2 + 1))
+                           + win_len // 2)
+
+        self._ana_interpolated = interp1d(anc_points[1, :], anc_points[0, :],
+                                          fill_value='extrapolate')
+        self._ana_slope = ((anc_points[0, 1] - anc_points[0, 0])
+                           / (anc_points[1, 1] - anc_points[1, 0]))
+
+        # input buffer, starting from the sample _in_start of the padded input.
+        self._in_buf = np.zeros((n_chan, win_len // 2), dtype=self.dtype)
+        self._in_start = 0
+        self._num_samples = 0
+
+        # output and normalizer buffer, starting from the sample _out_start.
+        self._y = np.zeros((n_chan, 0), dtype=self.dtype)
+        self._ow = np.zeros(0, dtype=self.dtype)
+        self._out_start = 0
+        self._emitted = 0
+
+        self._frame = 0
+        self._last_aw_pos = 0
+        self._state = None
+
+    def process(self, x):
+        """Time-stretch a block of the input audio sequence.
+
+        Parameters
+        ----------
+
+        x : numpy.ndarray [shape=(channel, num_samples) or (num_samples)]
+            a block of the input audio sequence.
+
+        Returns
+        -------
+
+        y : numpy.ndarray [shape=(channel, num_samples) or (num_samples)]
+            the output audio sequence which is ready.
+            The number of samples differs for each block,
+            and the channel axis is removed for a single channel.
+        """
+        x = _to_channel_axis(np.asarray(x), self.channel_axis)
+        x_block = np.reshape(x, (self.n_chan, -1)).astype(self.dtype,
+                                                          copy=False)
+        self._in_buf = np.concatenate((self._in_buf, x_block), axis=1)
+        self._num_samples += x_block.shape[1]
+
+        self._run()
+        y = self._emit(self._frame * self.syn_hop_size - self._win.size // 2)
+
+        return _to_channel_axis(y if self.n_chan > 1 else y[0],
+                                self.channel_axis)
+
+    def flush(self):
+        """Process the rest of the input after the last block.
+
+        Returns
+        -------
+
+        y : numpy.ndarray [shape=(channel, num_samples) or (num_samples)]
+            the remaining output audio sequence.
+        """
+        win_len = self._win.size
+
+        output_length = int(np.ceil(self.alpha * self._num_samples))
+        if self.length is not None:
+            output_length = int(np.ceil(self.alpha * self.length))
+        num_frames = len(range(0, output_length + self.win_size // 2,
+                               self.syn_hop_size))
+
+        # pad zeros after the end of the input.
+        need = (np.max(self._aw_pos(self._frame, num_frames), initial=0)
+                + win_len)
+        in_end = self._in_start + self._in_buf.shape[1]
+        if need > in_end:
+            self._in_buf = np.pad(self._in_buf, ((0, 0), (0, need - in_end)),
+                                  'constant')
+
+        self._run(num_frames)
+        y = self._emit(min(output_length, (num_frames - 1) * self.syn_hop_size
+                           + win_len - 2 * (win_len // 2)))
+
+        return _to_channel_axis(y if self.n_chan > 1 else y[0],
+                                self.channel_axis)
+
+    def _aw_pos(self, start, end):
+        sw_pos = np.arange(start, end) * self.syn_hop_size
+        return np.round(self._ana_interpolated(sw_pos)).astype(int)
+
+    def _run(self, num_frames=None):
+        win = self._win
+        win_len = win.size
+        in_end = self._in_start + self._in_buf.shape[1]
+
+        # frames of which the input is available.
+        start = self._frame
+        end = start + int(max(in_end - win_len - self._last_aw_pos, 0)
+                          / (self._ana_slope * self.syn_hop_size)) + 2
+        if num_frames is not None:
+            end = min(end, num_frames)
+        aw_pos = self._aw_pos(start, end)
+        aw_pos = aw_pos[aw_pos + win_len <= in_end]
+        if aw_pos.size == 0:
+            return
+        end = start + aw_pos.size
+
+        ana_hop = np.diff(aw_pos, prepend=self._last_aw_pos)
+
+        with _stage('stft', aw_pos.size):
+            frames = _frames(self._in_buf, aw_pos - self._in_start, win_len)
+            X = _analyze_frames(frames, win, self.fft_shift)
+            X = np.swapaxes(X, -1, -2)
+
+        X_ref = _link_channels(X, self.channel_link)
+        with _stage('phase_propagation', aw_pos.size):
+            Y, self._state = _propagate_phase(X, X_ref, ana_hop,
+                                              self.syn_hop_size,
+                                              self.win_size + self.zero_pad,
+                                              self.phase_lock, self._state)
+
+        with _stage('istft', aw_pos.size):
+            yi = _synthesize_frames(np.swapaxes(Y, -1, -2), win,
+                                    self.fft_shift, self.restore_energy)
+            y = _overlap_add(yi, self.syn_hop_size)
+            ow = _overlap_add(np.broadcast_to(self._win_sq,
+                                              (aw_pos.size, win_len)),
+                              self.syn_hop_size)
+
+        sw_pos = start * self.syn_hop_size - self._out_start
+        out_end = sw_pos + y.shape[-1]
+        if out_end > self._ow.size:
+            grow = out_end - self._ow.size
+            self._y = np.pad(self._y, ((0, 0), (0, grow)), 'constant')
+            self._ow = np.pad(self._ow, (0, grow), 'constant')
+        self._y[:, sw_pos: out_end] += y
+        self._ow[sw_pos: out_end] += ow
+
+        self._frame = end
+        self._last_aw_pos = aw_pos[-1]
+
+        # drop the input which is not needed anymore.
+        drop = self._aw_pos(end, end + 1)[0] - self._in_start
+        self._in_buf = self._in_buf[:, max(drop, 0):]
+        self._in_start += max(drop, 0)
+
+    def _emit(self, end):
+        # return the output until the sample end (excluded).
+        start = self._emitted + self._win.size // 2 - self._out_start
+        end = end + self._win.size // 2 - self._out_start
+        if end <= start:
+            return np.zeros((self.n_chan, 0), dtype=self.dtype)
+
+        ow = self._ow[start: end].copy()
+        ow[ow < 1e-3] = 1
+        y = self._y[:, start: end] / ow
+
+        self._y = self._y[:, end:]
+        self._ow = self._ow[end:]
+        self._out_start += end
+        self._emitted += end - start
+
+        return y
+
+
+class AnalysisCache:
+    """STFT analysis of an audio sequence, reusable for many stretch factors.
+    Use `analyze` to create it and `synthesize` to render an output.
+
+    Parameters
+    ----------
+
+    mag : numpy.ndarray [shape=(channel, num_frames, num_bins)]
+          magnitude of the STFT.
+    phase_advance : numpy.ndarray [shape=(channel, num_frames, num_bins)]
+                    phase advance of each frame from the previous frame,
+                    from the instantaneous frequency over the hop.
+                    The first frame holds its phase,
+                    so that the cumulative sum is the unwrapped phase.
+    length : int > 0 [scalar]
+             number of samples of the analyzed audio sequence.
+    hop_size : int > 0 [scalar]
+               hop size of the analysis frames.
+    win_type : str
+               type of the window function for the STFT.
+    win_size : int > 0 [scalar]
+               size of the window function.
+    zero_pad : int > 0 [scalar]
+               the size of the zero pad in the window function.
+    fft_shift : bool
+                apply circular shift to STFT and ISTFT.
+    """
+    def __init__(self, mag, phase_advance, length, hop_size, win_type='sin',
+                 win_size=2048, zero_pad=0, fft_shift=False):
+        self.mag = mag
+        self.phase_advance = phase_advance
+        self.length = length
+        self.hop_size = hop_size
+        self.win_type = win_type
+        self.win_size = win_size
+        self.zero_pad = zero_pad
+        self.fft_shift = fft_shift
+
+
+@_profiled('analyze')
+def analyze(x, win_type='sin', win_size=2048, hop_size=512, zero_pad=0,
+            fft_shift=False, dtype=np.float64, channel_axis=None):
+    """Analyze the audio sequence once for phase vocoder synthesis
+    with any number of time stretching factors.
+
+    `synthesize` interpolates the analysis at the analysis positions
+    of each factor, so that the STFT and the frame loop of
+    the phase propagation are not repeated for every factor.
+    The cache takes two arrays of the given dtype of size
+    channel x (win_size + zero_pad) / 2 x num_samples / hop_size.
+
+    Parameters
+    ----------
+
+    x : numpy.ndarray [shape=(channel, num_samples) or (num_samples)]
+        the input audio sequence to analyze.
+    win_type : str
+                type of the window function for the STFT.
+                hann and sin are available.
+    win_size : int > 0 [scalar]
+               size of the window function.
+    hop_size : int > 0 [scalar]
+               hop size of the analysis frames.
+               The default is the synthesis hop size,
+               with which the input is reconstructed without stretching.
+    zero_pad : int > 0 [scalar]
+               the size of the zero pad in the window function.
+    fft_shift : bool
+                apply circular shift to STFT and ISTFT.
+    dtype : numpy.dtype
+            floating point type of the analysis and the synthesis.
+    channel_axis : int or None
+                   the axis of the channels of a 2-D input.
+                   0 for (channel, num_samples), 1 or -1 for
+                   (num_samples, channel) such as the output of soundfile,
+                   which is used through a view without copying.
+                   None guesses it from the shape.
+
+    Returns
+    -------
+
+    analysis : AnalysisCache
+               the analysis of the input audio sequence.
+    """
+    x = _validate_audio(x, channel_axis)
+
+    # frames beyond the last position only contain the zero padding.
+    aw_pos = np.arange(0, x.shape[1] + win_size // 2 + hop_size, hop_size)
+    X = stft(x, ana_hop=aw_pos, win_type=win_type,
+             win_size=win_size, zero_pad=zero_pad, fft_shift=fft_shift,
+             dtype=dtype)
+
+    # the frames are kept along the second axis,
+    # so that every frame gathered by synthesize is contiguous in memory.
+    X = np.swapaxes(X, -1, -2)
+    ph_adv = np.angle(X)
+
+    # the deviation of the phase advance from the bin frequency is wrapped,
+    # the same as the heterodyned phase increment of phase_vocoder.
+    omega = 2 * np.pi * np.arange(X.shape[-1]) / (win_size + zero_pad)
+    omega = (omega * hop_size).astype(ph_adv.dtype)
+    ph_adv[:, 1:] -= ph_adv[:, :-1] + omega
+    ph_adv[:, 1:] -= 2 * np.pi * np.round(ph_adv[:, 1:] / (2 * np.pi))
+    ph_adv[:, 1:] += omega
+
+    return AnalysisCache(np.abs(X), ph_adv, x.shape[1], hop_size,
+                         win_type, win_size, zero_pad, fft_shift)
+
+
+@_profiled('synthesize')
+def synthesize(analysis, s, syn_hop_size=512, phase_lock=False,
+               restore_energy=False, out=None, channel_axis=0):
+    """Modify length of the analyzed audio sequence using Phase Vocoder.
+
+    The magnitude and the unwrapped phase are linearly interpolated
+    between the analysis frames. The synthesis phase advances by
+    the mean instantaneous frequency between two analysis positions,
+    integrated over the synthesis hop, so the input is reconstructed
+    when the analysis positions are spaced by `syn_hop_size`.
+    When they are spaced by exactly `hop_size` of the analysis,
+    the output is the same as `phase_vocoder` without phase locking.
+
+    Parameters
+    ----------
+
+    analysis : AnalysisCache
+               the analysis of the input audio sequence from `analyze`.
+    s : number > 0 [scalar] or numpy.ndarray [shape=(2, num_points)]
+         the time stretching factor. Either a constant value (alpha)
+         or an 2 x n array of anchor points which contains the sample points
+         of the input signal in the first row
+         and the sample points of the output signal in the second row.
+    syn_hop_size : int > 0 [scalar]
+                    hop size of the synthesis window.
+                    Usually half of the window size.
+    phase_lock : bool
+                 apply phase locking.
+                 The phase of each bin follows the accumulated phase of
+                 its peak in the nearest analysis frame.
+    restore_energy : bool
+                     tries to reserve potential energy loss.
+    out : numpy.ndarray [shape=(channel, num_samples) or (num_samples)]
+          the array to write the output to, with the shape of the output
+          and the dtype of the analysis. It can be reused across the calls.
+    channel_axis : int
+                   the axis of the channels of the output.
+                   0 for (channel, num_samples), 1 or -1 for
+                   (num_samples, channel) such as the input of soundfile.
+
+    Returns
+    -------
+
+    y : numpy.ndarray [shape=(channel, num_samples) or (num_samples)]
+        the modified output audio sequence.
+    """
+    n_chan, n_frames, n_bins = analysis.mag.shape
+    hop_size = analysis.hop_size
+    anc_points = _validate_scale_factor(
+        np.broadcast_to(0., (n_chan, analysis.length)), s)
+
+    output_length = int(anc_points[-1, -1]) + 1
+    y = _validate_out(out, n_chan, output_length, analysis.mag.dtype,
+                      channel_axis)
+
+    sw_pos = np.arange(0, output_length + analysis.win_size // 2,
+                       syn_hop_size)
+    ana_interpolated = interp1d(anc_points[1, :], anc_points[0, :],
+                                fill_value='extrapolate')
+    frame = np.clip(ana_interpolated(sw_pos) / hop_size, 0, n_frames - 1)
+    idx = np.minimum(np.floor(frame).astype(int), n_frames - 2)
+    frac = (frame - idx)[:, np.newaxis]
+
+    with _stage('phase_propagation', sw_pos.size):
+        # the unwrapped phase, accumulated in double precision
+        # so that it does not drift for numpy.float32.
+        ph_unwrap = np.cumsum(analysis.phase_advance, axis=-2,
+                              dtype=np.float64)
+
+        # interpolate between the analysis frames.
+        mag = analysis.mag[:, idx + 1] - analysis.mag[:, idx]
+        mag *= frac.astype(mag.dtype)
+        mag += analysis.mag[:, idx]
+        ph_ana = ph_unwrap[:, idx + 1] - ph_unwrap[:, idx]
+        ph_ana *= frac
+        ph_ana += ph_unwrap[:, idx]
+
+        # the phase advance over the analysis hop, scaled to the synthesis
+        # hop. Where the analysis position does not move, the advance is
+        # the instantaneous frequency at the position.
+        ana_hop = np.diff(frame) * hop_size
+        moved = ana_hop > 0
+        ph_syn = np.empty_like(ph_ana)
+        ph_syn[:, 0] = ph_ana[:, 0]  # phase initialization
+        np.subtract(ph_ana[:, 1:], ph_ana[:, :-1], out=ph_syn[:, 1:])
+        ph_syn[:, 1:][:, moved] *= (syn_hop_size
+                                    / ana_hop[moved])[:, np.newaxis]
+        if not np.all(moved):
+            ph_syn[:, 1:][:, ~moved] = (
+                analysis.phase_advance[:, idx[1:][~moved] + 1]
+                * (syn_hop_size / hop_size))
+        np.cumsum(ph_syn, axis=-2, out=ph_syn)
+
+        if phase_lock:
+            # the peaks of the nearest analysis frame, found once per frame.
+            near, inv = np.unique(np.round(frame).astype(int),
+                                  return_inverse=True)
+            with _stage('peak_picking', near.size):
+                peak_idx, has_peak = _find_peaks(analysis.mag[:, near])
+            peak_idx = peak_idx[:, inv]
+            has_peak = has_peak[:, inv]
+            ph_ana = ph_unwrap[:, near[inv]]
+            ph_syn -= ph_ana
+            ph_syn = np.take_along_axis(ph_syn, peak_idx, axis=-1)
+            ph_syn[~has_peak] = 0
+            ph_syn += ph_ana
+
+        # the phase is wrapped before it is cast to the dtype.
+        ph_syn -= 2 * np.pi * np.round(ph_syn / (2 * np.pi))
+        ph_syn = ph_syn.astype(mag.dtype, copy=False)
+
+    Y = np.empty(mag.shape, np.result_type(mag.dtype, np.complex64))
+    np.cos(ph_syn, out=Y.real)
+    np.sin(ph_syn, out=Y.imag)
+    Y.real *= mag
+    Y.imag *= mag
+
+    istft(np.swapaxes(Y, -1, -2), syn_hop=syn_hop_size,
+          win_type=analysis.win_type, win_size=analysis.win_size,
+          zero_pad=analysis.zero_pad, num_iter=1,
+          original_length=output_length, fft_shift=analysis.fft_shift,
+          restore_energy=restore_energy, out=y)
+
+    if out is None:
+        return _to_channel_axis(y.squeeze(), channel_axis)
+    return out
+
+
+def _link_channels(X, channel_link):
+    """Make the reference spectrum for the phase propagation.
+
+    Parameters
+    ----------
+    X : numpy.ndarray [shape=(channel, num_bins, num_frames)]
+        the STFT of the input audio sequence.
+    channel_link : str or None
+                   mode to share the phase propagation across the channels.
+                   None, mid and sum are available.
+
+    Returns
+    -------
+
+    X_ref : numpy.ndarray [shape=(channel or 1, num_bins, num_frames)]
+            the reference spectrum.
+    """
+    if channel_link is None:
+        X_ref = X
+    elif channel_link == 'mid':
+        X_ref = np.mean(X, axis=0, keepdims=True)
+    elif channel_link == 'sum':
+        X_ref = (np.sum(np.abs(X), axis=0, keepdims=True)
+                 * np.exp(1j * np.angle(np.mean(X, axis=0, keepdims=True))))
+    else:
+        raise Exception("Please use the valid channel link mode. "
+                        + "(None, mid, sum)")
+
+    return X_ref
+
+
+def _propagate_phase(X, X_ref, ana_hop, syn_hop_size, N, phase_lock,
+                     state=None):
+    """Propagate the phase of the analysis frames to the synthesis frames.
 
     Parameters
     ----------
-    spec : numpy.ndarray [shape=(num_bins)]
-           A single frame from the STFT.
+    X : numpy.ndarray [shape=(channel, num_bins, num_frames)]
+        the STFT of the input audio sequence.
+    X_ref : numpy.ndarray [shape=(channel or 1, num_bins, num_frames)]
+            the reference spectrum for the phase propagation.
+    ana_hop : numpy.ndarray [shape=(num_frames)]
+              hop size from the previous analysis frame.
+    syn_hop_size : int > 0 [scalar]
+                   hop size of the synthesis window.
+    N : int > 0 [scalar]
+        size of the FFT.
+    phase_lock : bool
+                 apply phase locking.
+    state : tuple or None
+            the analysis and synthesis phase of the previous frame
+            returned by the previous call.
+            If None, the phase of the first frame is kept.
 
     Returns
     -------
 
-    peaks : numpy.ndarray [shape=(num_peaks)]
-            an array with peaks in the STFT frame.
-    infl_region: numpy.ndarray [shape=(2, num_peaks)]
-            Region of influence for each peak.
+    Y : numpy.ndarray [shape=(channel, num_bins, num_frames)]
+        the STFT with the propagated phase.
+    state : tuple
+            the analysis and synthesis phase of the last frame.
     """
+    k = np.arange(N / 2 + 1)
+
+    omega = (2 * np.pi * k / N).astype(X.real.dtype)
+
+    if phase_lock:
+        # find the region of influence of the peaks of every frame at once.
+        with _stage('peak_picking', X.shape[-1]):
+            peak_idx, has_peak = _find_peaks(np.swapaxes(np.abs(X_ref),
+                                                         -1, -2))
 
-    mag_spec = np.abs(spec)
-    mag_spec_padded = np.pad(mag_spec, 2, 'constant')
+    Y = np.zeros_like(X)
+    if state is None:
+        Y[..., 0] = X[..., 0]  # phase initialization
+        ph_last = ph_syn = np.angle(X_ref[..., 0])
+        start = 1
+    else:
+        ph_last, ph_syn = state
+        start = 0
+
+    for i in range(start, X.shape[-1]):
+        hop = int(ana_hop[i])
+        dphi = omega * hop
+
+        ph_curr = np.angle(X_ref[..., i])
+
+        hpi = (ph_curr - ph_last) - dphi
+        hpi = hpi - 2 * np.pi * np.round(hpi / (2 * np.pi))
+
+        ipa_sample = (omega + hpi / hop)
 
-    peaks = ((mag_spec_padded[4:] < mag_spec)
-             * (mag_spec_padded[3: -1] < mag_spec)
-             * (mag_spec_padded[1: -3] < mag_spec)
-             * (mag_spec_padded[: -4] < mag_spec))
-    peaks = np.where(peaks)[0]
+        ipa_hop = ipa_sample * syn_hop_size
 
-    if peaks.size == 0:
-        return peaks, np.empty(0)
+        theta = ph_syn + ipa_hop - ph_curr
+        if phase_lock:
+            # every bin follows the phase of the peak it belongs to.
+            theta = np.take_along_axis(theta, peak_idx[..., i, :], axis=-1)
+            theta[~has_peak[..., i]] = 0
 
-    # Find region of influence. Axis 0 represents start and end each.
-    infl_region = np.zeros((2, peaks.size))
-    infl_region[0, 0] = 0
-    infl_region[0, 1:] = np.ceil((peaks[1:] + peaks[: -1]) / 2)
-    infl_region[1, : -1] = infl_region[0, 1:] - 1
-    infl_region[1, -1] = spec.size - 1
+        phasor = np.exp(1j * theta)
 
-    return peaks, infl_region.astype(int)
+        Y[..., i] = phasor * X[..., i]
+        ph_syn = np.angle(Y[..., i] if X_ref is X else phasor * X_ref[..., i])
+        ph_last = ph_curr
+
+    return Y, (ph_last, ph_syn)
+
+
+def _find_peaks(mag_spec):
+    """ Find the region of influence of the peaks in spectrogram.
+    A value which it the largest value among its four nearest neighbors
+    is treated as a peak, and each bin belongs to its nearest peak.
+    All frames are processed at once.
+
+    Parameters
+    ----------
+    mag_spec : numpy.ndarray [shape=(..., num_bins)]
+               magnitude of the STFT frames. The last axis is frequency.
+
+    Returns
+    -------
+
+    peak_idx : numpy.ndarray [shape=(..., num_bins)]
+               index of the peak which each bin belongs to.
+    has_peak : numpy.ndarray [shape=(...)]
+               whether each frame has any peak.
+    """
+    n_bins = mag_spec.shape[-1]
+    pad = [(0, 0)] * (mag_spec.ndim - 1) + [(2, 2)]
+    mag_spec_padded = np.pad(mag_spec, pad, 'constant')
+
+    peaks = ((mag_spec_padded[..., 4:] < mag_spec)
+             & (mag_spec_padded[..., 3: -1] < mag_spec)
+             & (mag_spec_padded[..., 1: -3] < mag_spec)
+             & (mag_spec_padded[..., : -4] < mag_spec))
+
+    # nearest peak below and above each bin.
+    k = np.arange(n_bins, dtype=np.int32)
+    prev_peak = np.maximum.accumulate(np.where(peaks, k, -1), axis=-1)
+    next_peak = np.where(peaks, k, n_bins)
+    next_peak = np.flip(np.minimum.accumulate(np.flip(next_peak, -1), axis=-1),
+                        -1)
+
+    # a bin belongs to the nearer peak, and to the upper one on a tie.
+    use_prev = (prev_peak >= 0) & ((next_peak == n_bins)
+                                   | (k - prev_peak < next_peak - k))
+    peak_idx = np.where(use_prev, prev_peak, next_peak)
+
+    has_peak = next_peak[..., 0] < n_bins
+    peak_idx[~has_peak] = 0
+
+    return peak_idx, has_peak
@@ -1,11 +1,20 @@
+from bisect import bisect_left
+
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 
 from .utils import win as win_func
 from .utils import _validate_audio, _validate_f0
+from .utils.validate import _validate_out, _to_channel_axis
+from .utils.stft import _frames
+from .utils.threads import _thread_map
+from .utils.profiling import _profiled
 
 
+@_profiled('tdpsola')
 def tdpsola(x, sr, src_f0, tgt_f0=None, alpha=1, beta=None,
-            win_type='hann', p_hop_size=441, p_win_size=1470):
+            win_type='hann', p_hop_size=441, p_win_size=1470,
+            dtype=np.float64, out=None, channel_axis=None):
     """Modify length and pitch of the audio sequnce using TD-PSOLA algorithm.
 
     Parameters
@@ -32,6 +41,17 @@ def tdpsola(x, sr, src_f0, tgt_f0=None, alpha=1, beta=None,
     p_win_size : int > 0 [scalar]
                  the window size of pitch tracking algorithm
                  you used. (in samples).
+    dtype : numpy.dtype
+            floating point type of the computation.
+    out : numpy.ndarray [shape=(channel, num_samples) or (num_samples)]
+          the array to write the output to, with the shape of the output
+          and the given dtype. It can be reused across the calls.
+    channel_axis : int or None
+                   the axis of the channels of a 2-D input and the output.
+                   0 for (channel, num_samples), 1 or -1 for
+                   (num_samples, channel) such as the output of soundfile,
+                   which is used through a view without copying.
+                   None guesses it from the shape.
 
     Returns
     -------
@@ -40,7 +60,7 @@ def tdpsola(x, sr, src_f0, tgt_f0=None, alpha=1, beta=None,
         the modified output audio sequence.
     """
     # validate the input audio, input pitch and scale factor.
-    x = _validate_audio(x)
+    x = _validate_audio(x, channel_axis).astype(dtype, copy=False)
     src_f0 = _validate_f0(x, src_f0)
     if tgt_f0 is not None:
         if beta is not None:
@@ -49,14 +69,15 @@ def tdpsola(x, sr, src_f0, tgt_f0=None, alpha=1, beta=None,
     elif beta is None:
         beta = 1
 
-    min_f0 = src_f0[np.nonzero(src_f0)].min()
-    pad_len = int(np.ceil(sr / min_f0)) + p_win_size
-
     n_chan = x.shape[0]
     output_length = int(np.ceil(x.shape[1] * alpha))
-    y = np.zeros((n_chan, output_length))
+    y = _validate_out(out, n_chan, output_length, dtype, channel_axis)
 
-    for c, x_chan in enumerate(x):
+    # pitch marks depend on each channel's signal,
+    # so the grain schedule is computed per channel,
+    # and the channels are processed in the thread pool.
+    def process_channel(c):
+        x_chan = x[c]
         src_f0_chan = src_f0[c]
         src_f0_chan[np.isnan(src_f0_chan)] = 0
         pm_chan = _find_pitch_marks(x_chan, sr, src_f0_chan, p_hop_size,
@@ -81,42 +102,151 @@ def tdpsola(x, sr, src_f0, tgt_f0=None, alpha=1, beta=None,
             pitch_period = np.append(pitch_period, pitch_period[-1])
             beta_seq = np.append(beta_seq, beta_seq[-1])
 
-        output_length = int(np.ceil(x_chan.size * alpha))
+        # compute the whole grain schedule first,
+        # then overlap-add the grains in batches.
+        out_pm, src_idx = _grain_schedule(pm_chan, pitch_period, beta_seq,
+                                          alpha, output_length)
+        _overlap_add_grains(x_chan, pm_chan[src_idx], out_pm,
+                            pitch_period[src_idx], win_type,
+                            output_length, out=y[c])
 
-        # pad = int(np.ceil(sr / 100))
-        x_chan = np.pad(x_chan, (pad_len, pad_len), 'constant')
-        y_chan = np.zeros(output_length + 2 * pad_len)  # output signal
+    _thread_map(process_channel, range(n_chan))
 
-        tk = pitch_period[0] + 1  # output pitch mark
-        ow = np.zeros(y_chan.shape)
+    if out is None:
+        return _to_channel_axis(np.squeeze(y), channel_axis)
+    return out
 
-        while np.round(tk) < output_length:
-            i = min(np.argmin(np.abs(alpha * pm_chan - tk)),
-                    pitch_period.size - 1)  # find analysis segment
-            pit = pitch_period[i]
 
-            win = win_func(win_type=win_type, win_size=2 * pit + 1)
+def _grain_schedule(pitch_mark, pitch_period, beta, alpha, output_length):
+    """Compute the output pitch marks and the analysis grain of each of them.
 
-            st = pm_chan[i] - pit
-            en = pm_chan[i] + pit
+    Parameters
+    ----------
 
-            gr = x_chan[st + pad_len: en + pad_len + 1] * win
+    pitch_mark : numpy.ndarray [shape=(num_pitch_marks)]
+                 pitch marks of the input audio sequence.
+    pitch_period : numpy.ndarray [shape=(num_pitch_marks)]
+                   pitch period of each pitch mark.
+    beta : numpy.ndarray [shape=(num_pitch_marks)]
+           pitch-shifting rate of each pitch mark.
+    alpha : number > 0 [scalar]
+            time stretching factor.
+    output_length : int > 0 [scalar]
+                    length of the output audio sequence.
 
-            ini_gr = int(round(tk)) - pit + pad_len
-            end_gr = int(round(tk)) + pit + pad_len
+    Returns
+    -------
 
-            y_chan[ini_gr: end_gr + 1] = y_chan[ini_gr: end_gr + 1] + gr
-            ow[ini_gr: end_gr + 1] = ow[ini_gr: end_gr + 1] + win
-            tk = tk + pit / beta_seq[i]
+    out_pm : numpy.ndarray [shape=(num_grains)]
+             rounded output pitch marks.
+    src_idx : numpy.ndarray [shape=(num_grains)]
+              index of the analysis pitch mark used for each output pitch mark.
+    """
+    # each output pitch mark depends on the previous grain,
+    # so the marks are placed one by one, but the nearest analysis mark
+    # is found by a binary search over the sorted pitch marks.
+    ana_pm = (alpha * pitch_mark).tolist()
+    step = (pitch_period / beta[: pitch_period.size]).tolist()
+    last = pitch_period.size - 1
+
+    out_pm = []
+    src_idx = []
+    tk = float(pitch_period[0] + 1)  # output pitch mark
+    while round(tk) < output_length:
+        i = bisect_left(ana_pm, tk)
+        # take the nearest mark, the earlier one on a tie.
+        if i == len(ana_pm) or (i > 0
+                                and tk - ana_pm[i - 1] <= ana_pm[i] - tk):
+            i -= 1
+        i = min(i, last)
+
+        out_pm.append(round(tk))
+        src_idx.append(i)
+        tk = tk + step[i]
+
+    return np.array(out_pm, dtype=int), np.array(src_idx, dtype=int)
+
+
+@_profiled('overlap_add')
+def _overlap_add_grains(x, grain_pos, out_pos, periods, win_type, length,
+                        out=None):
+    """Overlap-add windowed grains and normalize by the window sum.
+
+    Grains of the same pitch period share a window,
+    so they are extracted, windowed and added together.
+    The grains reaching outside the input are filled with zeros,
+    and the grains reaching outside the output are cut.
 
-        ow[ow < 1e-3] = 1
+    Parameters
+    ----------
 
-        y_chan = y_chan / ow
-        y_chan = y_chan[pad_len:]
-        y_chan = y_chan[: output_length]
-        y[c, :] = y_chan
+    x : numpy.ndarray [shape=(num_samples)]
+        the input audio sequence.
+    grain_pos : numpy.ndarray [shape=(num_grains)]
+                center of each grain in the input audio sequence.
+    out_pos : numpy.ndarray [shape=(num_grains)]
+              center of each grain in the output audio sequence.
+              Should be increasing.
+    periods : numpy.ndarray [shape=(num_grains)]
+              pitch period of each grain. A grain is 2 * period + 1 long.
+    win_type : str
+               type of the window function. hann and sin are available.
+    length : int > 0 [scalar]
+             length of the output audio sequence.
+    out : numpy.ndarray [shape=(length)]
+          the array to write the output to.
+
+    Returns
+    -------
 
-    return np.squeeze(y)
+    y : numpy.ndarray [shape=(length)]
+        the overlap-added output audio sequence.
+    """
+    if out is None:
+        y = np.zeros(length, dtype=x.dtype)
+    else:
+        y = out
+        y.fill(0)
+    ow = np.zeros(length, dtype=x.dtype)
+
+    for pit in np.unique(periods):
+        sel = periods == pit
+        gr_len = 2 * pit + 1
+        win = win_func(win_type=win_type, win_size=gr_len, dtype=x.dtype)
+
+        src = grain_pos[sel] - pit
+        dst = out_pos[sel] - pit
+        grains = _frames(x, src, gr_len) * win
+        inside = (dst >= 0) & (dst + gr_len <= length)
+
+        # grains which are n_layers apart never overlap,
+        # so each layer can be added at once.
+        n_layers = 1
+        if dst.size > 1:
+            n_layers = int(np.ceil(gr_len / max(np.diff(dst).min(), 1)))
+
+        if length >= gr_len:
+            y_frames = sliding_window_view(y, gr_len, writeable=True)
+            ow_frames = sliding_window_view(ow, gr_len, writeable=True)
+        for k in range(n_layers):
+            layer = np.arange(k, dst.size, n_layers)
+            inner = layer[inside[layer]]
+            if inner.size:
+                y_frames[dst[inner]] += grains[inner]
+                ow_frames[dst[inner]] += win
+
+            # only the grains at the edges of the output are cut.
+            for i in layer[~inside[layer]]:
+                lo = max(dst[i], 0)
+                hi = min(dst[i] + gr_len, length)
+                if hi > lo:
+                    y[lo: hi] += grains[i, lo - dst[i]: hi - dst[i]]
+                    ow[lo: hi] += win[lo - dst[i]: hi - dst[i]]
+
+    ow[ow < 1e-3] = 1
+    y /= ow
+
+    return y
 
 
 def _target_f0_to_beta(x, pitch_mark, source_f0, target_f0):
@@ -142,22 +272,17 @@ def _target_f0_to_beta(x, pitch_mark, source_f0, target_f0):
     beta : numpy.ndarray [shape=(num_pitch_marks)]
            time-varying pitch-shifting rate.
     """
-    beta = np.zeros(pitch_mark.size)
-    for i in range(beta.size):
-        idx = round(pitch_mark[i] * source_f0.size / x.size)
-        if idx < 0:
-            idx = 0
-        elif idx >= source_f0.size:
-            idx = source_f0.size - 1
-
-        if (not target_f0[idx] == 0) and (not source_f0[idx] == 0):
-            beta[i] = target_f0[idx] / source_f0[idx]
-        else:
-            beta[i] = 1
+    idx = np.round(pitch_mark * source_f0.size / x.size).astype(int)
+    idx = np.clip(idx, 0, source_f0.size - 1)
+
+    voiced = (target_f0[idx] != 0) & (source_f0[idx] != 0)
+    beta = np.ones(pitch_mark.size)
+    beta[voiced] = target_f0[idx][voiced] / source_f0[idx][voiced]
 
     return beta
 
 
+@_profiled('pitch_marks')
 def _find_pitch_marks(x, sr, f0, hop_size, win_size):
     """Find pitch marks for TD-PSOLA.
 
@@ -183,38 +308,34 @@ def _find_pitch_marks(x, sr, f0, hop_size, win_size):
         pitch_marks extracted from the input audio sequence.
     """
 
-    # Initialization
-    m = np.array([0])  # vector of pitch mark positions
-
     # set pitch periods of unvoiced frames
     if f0[0] == 0:
         f0[0] = 120
-    for i in range(f0.size):
-        if f0[i] == 0:
-            f0[i] = f0[i - 1]
+    last_voiced = np.where(f0 != 0, np.arange(f0.size), 0)
+    f0[:] = f0[np.maximum.accumulate(last_voiced)]
 
     p0 = np.round(sr / f0)
-    search_up_lim = int(p0[0])
-    last_m = 0
-
-    # processing frames i
-    for i in range(f0.size):
-        if i == 0:
-            loc = np.argmax(x[: search_up_lim])
-            local_m = np.array([loc])
-        else:
-            search_up_lim = search_up_lim + p0[i]
-            local_m = np.array([last_m + p0[i]])
-
-        while search_up_lim + p0[i] <= win_size + i * hop_size - 1:
-            search_up_lim = search_up_lim + p0[i]
-            local_m = np.append(local_m, local_m[-1] + p0[i])
-
-        m = np.append(m, local_m)
-        last_m = local_m[-1]
 
-    m = np.sort(m)
-    m = np.unique(m)
+    # the search limit moves by whole periods, one pitch mark each,
+    # as far as the end of the analysis window of every frame allows.
+    # only the number of marks per frame is computed sequentially.
+    num_marks = np.zeros(f0.size, dtype=int)
+    periods = p0.tolist()
+    search_up_lim = periods[0]
+    for i, p in enumerate(periods):
+        if i > 0:
+            search_up_lim += p
+            num_marks[i] = 1
+        win_end = win_size + i * hop_size - 1
+        if search_up_lim + p <= win_end:
+            n = int((win_end - search_up_lim) // p)
+            search_up_lim += n * p
+            num_marks[i] += n
+
+    loc = np.argmax(x[: int(p0[0])])
+    m = loc + np.cumsum(np.append(0, np.repeat(p0, num_marks)))
+
+    m = np.unique(np.append(0, m))
     m = m[1:]
 
     return m.astype(int)
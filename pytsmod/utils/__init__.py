@@ -1,3 +1,5 @@
 from .stft import *
 from .win import *
+from .threads import *
+from .profiling import *
 from .validate import _validate_audio, _validate_scale_factor, _validate_f0
@@ -0,0 +1,186 @@
+import contextlib
+import functools
+import threading
+import time
+import tracemalloc
+
+
+__all__ = ['profile', 'Profile']
+
+_profiles = []
+_lock = threading.Lock()
+_local = threading.local()
+_null_stage = contextlib.nullcontext()
+
+
+class Profile:
+    """Measurements of the stages of pytsmod recorded by `profile`.
+
+    The stages are the public functions (wsola, phase_vocoder, hptsm, ...)
+    and their steps: stft, istft, phase_propagation, peak_picking,
+    correlation_search, normalization, median_filter, pitch_marks
+    and overlap_add. A stage run inside another one is also counted
+    in the outer one, e.g. stft inside hp_separate inside hptsm.
+
+    Attributes
+    ----------
+
+    stages : dict
+             for each stage name, a dict of the number of calls,
+             the wall time in seconds, the number of frames processed
+             and the peak of the memory allocated in bytes
+             (calls, seconds, frames, peak_bytes).
+             peak_bytes is the largest over the calls,
+             and it is 0 unless the memory is profiled.
+    """
+    def __init__(self, callback=None, memory=False):
+        self.stages = {}
+        self.callback = callback
+        self.memory = memory
+
+    def report(self):
+        """The stages sorted by their wall time.
+
+        Returns
+        -------
+
+        report : list of dict
+                 the measurements of each stage with its name (stage).
+        """
+        stages = [{'stage': name, **stats}
+                  for name, stats in self.stages.items()]
+        return sorted(stages, key=lambda stage: -stage['seconds'])
+
+    def __str__(self):
+        lines = [f"{'stage':<20}{'calls':>8}{'seconds':>12}{'frames':>10}"
+                 + f"{'peak MiB':>10}"]
+        for stage in self.report():
+            lines.append(f"{stage['stage']:<20}{stage['calls']:>8}"
+                         + f"{stage['seconds']:>12.4f}{stage['frames']:>10}"
+                         + f"{stage['peak_bytes'] / 2 ** 20:>10.1f}")
+        return '\n'.join(lines)
+
+    def _record(self, name, seconds, frames, peak_bytes):
+        stats = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.,
+                                              'frames': 0, 'peak_bytes': 0})
+        stats['calls'] += 1
+        stats['seconds'] += seconds
+        stats['frames'] += frames
+        stats['peak_bytes'] = max(stats['peak_bytes'], peak_bytes)
+
+
+@contextlib.contextmanager
+def profile(callback=None, memory=False):
+    """Context manager to record the stages of pytsmod run inside it,
+    in any thread. Nothing is recorded outside of it.
+
+    Parameters
+    ----------
+
+    callback : callable or None
+               called as callback(stage, seconds, frames, peak_bytes)
+               at the end of every stage, e.g. to export the measurements.
+    memory : bool
+             also record the peak of the memory allocated in each stage
+             with tracemalloc. It slows down the processing,
+             and stages in other threads are counted together.
+
+    Returns
+    -------
+
+    profile : Profile
+              the measurements, updated until the exit.
+    """
+    prof = Profile(callback, memory)
+    started = memory and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+
+    with _lock:
+        _profiles.append(prof)
+    try:
+        yield prof
+    finally:
+        with _lock:
+            _profiles.remove(prof)
+        if started:
+            tracemalloc.stop()
+
+
+def _stage(name, frames=0):
+    """Context manager to measure a stage for the active profiles.
+
+    Parameters
+    ----------
+
+    name : str
+           name of the stage.
+    frames : int >= 0 [scalar]
+             number of frames processed in the stage.
+    """
+    if not _profiles:
+        return _null_stage
+    return _Stage(name, frames)
+
+
+def _profiled(name, frames=0):
+    """Decorator to measure every call of a function as a stage.
+
+    Parameters
+    ----------
+
+    name : str
+           name of the stage.
+    frames : int >= 0 [scalar]
+             number of frames processed in each call.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _profiles:
+                return func(*args, **kwargs)
+            with _Stage(name, frames):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _Stage:
+    def __init__(self, name, frames):
+        self.name = name
+        self.frames = frames
+        self.memory = (any(prof.memory for prof in _profiles)
+                       and tracemalloc.is_tracing())
+
+    def __enter__(self):
+        if self.memory:
+            # the peak of the outer stage is kept before it is reset.
+            current, peak = tracemalloc.get_traced_memory()
+            stack = _local.__dict__.setdefault('stack', [])
+            if stack:
+                stack[-1][1] = max(stack[-1][1], peak)
+            stack.append([current, current])
+            tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+
+        peak_bytes = 0
+        if self.memory:
+            stack = _local.stack
+            start, peak = stack.pop()
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            if stack:
+                stack[-1][1] = max(stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            peak_bytes = peak - start
+
+        with _lock:
+            profiles = list(_profiles)
+            for prof in profiles:
+                prof._record(self.name, seconds, self.frames, peak_bytes)
+
+        for prof in profiles:
+            if prof.callback is not None:
+                prof.callback(self.name, seconds, self.frames, peak_bytes)
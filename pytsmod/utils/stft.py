@@ -1,16 +1,20 @@
 import numpy as np
-from .win import win as win_func
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import fft
+from .win import win as win_func, _squared_win
+from .threads import get_num_threads
+from .profiling import _stage
 
 
 def stft(x, ana_hop=2048, win_type='hann', win_size=4096, zero_pad=0, sr=44100,
-         fft_shift=0, time_frequency_out=False):
+         fft_shift=0, time_frequency_out=False, dtype=np.float64):
     """Short-Time Fourier Transform (STFT) for the audio signal.
     This function is used for phase vocoder.
 
     Parameters
     ----------
-    x : numpy.ndarray [shape=(num_samples)]
-        the input audio sequence. Should be a single channel.
+    x : numpy.ndarray [shape=(channel, num_samples) or (num_samples)]
+        the input audio sequence. All channels are analyzed at once.
     ana_hop : int > 0 [scalar] or numpy.ndarray [shape=(num_frames)]
               either a analysis hop size (scalar)
               or analyze window positions (array).
@@ -28,11 +32,15 @@ def stft(x, ana_hop=2048, win_type='hann', win_size=4096, zero_pad=0, sr=44100,
     time_frequency_out : bool
                          returns time and frequency axis indices
                          in (spec, t, f).
+    dtype : numpy.dtype
+            floating point type of the computation.
+            numpy.float32 gives a numpy.complex64 spectrogram.
 
     Returns
     -------
 
-    spec : numpy.ndarray [shape=(win_size // 2 + 1, num_frames)]
+    spec : numpy.ndarray [shape=(channel, win_size // 2 + 1, num_frames) \
+                          or (win_size // 2 + 1, num_frames)]
            the STFT result of the input audio sequence.
     t : numpy.ndarray [shape=num_frames]
         timestamp of the output result.
@@ -40,27 +48,29 @@ def stft(x, ana_hop=2048, win_type='hann', win_size=4096, zero_pad=0, sr=44100,
         frequency value for each frequency bin of the output result.
     """
 
-    win = win_func(win_type=win_type, win_size=win_size, zero_pad=zero_pad)
+    # the frames are converted after they are gathered,
+    # so that a long input such as numpy.memmap is not copied as a whole.
+    x = np.asarray(x)
+    win = win_func(win_type=win_type, win_size=win_size, zero_pad=zero_pad,
+                   dtype=dtype)
     win_size = win.size
 
-    max_ana_hop = np.max(ana_hop)
-    x_padded = np.pad(x, (win_size // 2, win_size + max_ana_hop), 'constant')
-
+    # the window positions are given in the input padded with
+    # win_size // 2 zeros on the left and win_size + max_ana_hop on the right.
+    # the padding is not copied, the frames at the edges are filled with zeros.
     if np.isscalar(ana_hop):
-        num_frames = int((len(x_padded) - win_size) / ana_hop + 1)
+        padded_length = x.shape[-1] + win_size // 2 + win_size + ana_hop
+        num_frames = int((padded_length - win_size) / ana_hop + 1)
         win_pos = np.arange(num_frames) * ana_hop
     else:
         num_frames = ana_hop.size
         win_pos = ana_hop[0:num_frames]
 
-    spec = np.zeros((win_size // 2 + 1, num_frames), dtype=np.complex128)
-    for i in range(num_frames):
-        xi = x_padded[win_pos[i]: win_pos[i] + win_size] * win
-
-        if fft_shift:
-            xi = np.append(xi[len(xi) // 2:], xi[0: len(xi) // 2])
-        Xi = np.fft.fft(xi)
-        spec[:, i] = Xi[0: win_size // 2 + 1]
+    with _stage('stft', num_frames):
+        # gather every frame at once, window them and transform in one batch.
+        frames = _frames(x, win_pos - win_size // 2, win_size)
+        frames = frames.astype(dtype, copy=False)
+        spec = np.swapaxes(_analyze_frames(frames, win, fft_shift), -1, -2)
 
     if time_frequency_out:
         t = (win_pos - 1) / sr
@@ -72,14 +82,15 @@ def stft(x, ana_hop=2048, win_type='hann', win_size=4096, zero_pad=0, sr=44100,
 
 def istft(spec, syn_hop=2048, win_type='hann', win_size=4096, zero_pad=0,
           num_iter=1, original_length=-1, fft_shift=False,
-          restore_energy=False):
+          restore_energy=False, out=None):
     """Inverse Short-Time Fourier Transform to recover the audio signal
     from the spectrogram. This function is used for phase vocoder.
 
     Parameters
     ----------
 
-    X : numpy.ndarray [shape=(num_bins, num_frames)]
+    X : numpy.ndarray [shape=(channel, num_bins, num_frames) \
+                       or (num_bins, num_frames)]
         the input audio complex spectrogram.
     syn_hop : int > 0 [scalar]
               the hop size of the synthesis window.
@@ -99,43 +110,54 @@ def istft(spec, syn_hop=2048, win_type='hann', win_size=4096, zero_pad=0,
                 apply circular shift to ISTFT.
     restore_energy : bool
                      tries to reserve potential energy loss.
+    out : numpy.ndarray [shape=(channel, num_samples) or (num_samples)]
+          the array to write the output to.
+          Its length is used instead of original_length.
 
     Returns
     -------
 
-    y : numpy.ndarray [shape=(original_length)]
+    y : numpy.ndarray [shape=(channel, original_length) \
+                       or (original_length)]
         the output audio sequence.
+        numpy.float32 for a numpy.complex64 spectrogram.
     """
 
     Yi = spec
+    win_pos = np.arange(spec.shape[-1]) * syn_hop
     yi = lsee_mstft(Yi, syn_hop, win_type, win_size,
-                    zero_pad, fft_shift, restore_energy)
+                    zero_pad, fft_shift, restore_energy,
+                    out=out if num_iter == 1 else None)
 
-    for _ in range(1, num_iter):
-        Yi = np.abs(spec) * np.exp(1j*np.angle(stft(yi, ana_hop=syn_hop,
+    for i in range(1, num_iter):
+        Yi = np.abs(spec) * np.exp(1j*np.angle(stft(yi, ana_hop=win_pos,
                                                     win_type=win_type,
                                                     win_size=win_size,
-                                                    zero_pad=zero_pad)))
+                                                    zero_pad=zero_pad,
+                                                    fft_shift=fft_shift,
+                                                    dtype=yi.dtype)))
         yi = lsee_mstft(Yi, syn_hop, win_type, win_size,
-                        zero_pad, fft_shift, restore_energy)
+                        zero_pad, fft_shift, restore_energy,
+                        out=out if i == num_iter - 1 else None)
 
     y = yi
 
-    if original_length > 0:
-        y = y[: original_length]
+    if out is None and original_length > 0:
+        y = y[..., : original_length]
 
     return y
 
 
 def lsee_mstft(X, syn_hop, win_type, win_size, zero_pad, fft_shift,
-               restore_energy):
+               restore_energy, out=None):
     """Least Squares Error Estimation from the MSTFT (Modified STFT).
     Griffin-Lim procedure to estimate the audio signal from the modified STFT.
 
     Parameters
     ----------
 
-    X : numpy.ndarray [shape=(num_bins, num_frames)]
+    X : numpy.ndarray [shape=(channel, num_bins, num_frames) \
+                       or (num_bins, num_frames)]
         the input audio complex spectrogram.
     syn_hop : int > 0 [scalar]
               the hop size of the synthesis window.
@@ -150,45 +172,227 @@ def lsee_mstft(X, syn_hop, win_type, win_size, zero_pad, fft_shift,
                 apply circular shift to ISTFT.
     restore_energy : bool
                      tries to reserve potential energy loss.
+    out : numpy.ndarray [shape=(channel, num_samples) or (num_samples)]
+          the array to write the output to.
+          The samples after the end of the output are zeros.
 
     Returns
     -------
 
-    x : numpy.ndarray [shape=num_samples]
+    x : numpy.ndarray [shape=(channel, num_samples) or (num_samples)]
         the output audio sequence through LSEE_MSTFT
     """
 
-    w = win_func(win_type, win_size, zero_pad)
+    dtype = X.real.dtype
+    w = win_func(win_type, win_size, zero_pad, dtype=dtype)
 
     win_len = len(w)
-    n_frames = X.shape[1]
-    win_pos = np.arange(n_frames) * syn_hop
-    signal_length = win_pos[-1] + win_len
+    n_frames = X.shape[-1]
 
-    x = np.zeros(signal_length)
-    ow = np.zeros(signal_length)
-    for i in range(n_frames):
-        curr_spec = X[:, i]
+    with _stage('istft', n_frames):
+        # inverse transform every frame of every channel at once.
+        xiw = _synthesize_frames(np.swapaxes(X, -1, -2), w, fft_shift,
+                                 restore_energy)
 
-        Xi = np.append(curr_spec, np.flip(np.conj(curr_spec[1:-1])))
-        xi = np.real(np.fft.ifft(Xi))
-        if fft_shift:
-            xi = np.fft.fftshift(xi)
+        x = _overlap_add(xiw, syn_hop)
+        w_sq = _squared_win(win_type, win_size, zero_pad, dtype)
+        ow = _overlap_add(np.broadcast_to(w_sq, (n_frames, win_len)), syn_hop)
 
-        xiw = xi * w
+    ow[ow < 1e-3] = 1
 
-        if restore_energy:
-            xi_energy = np.sum(abs(xi))
-            xiw_energy = np.sum(abs(xiw))
-            xiw = xiw * (xi_energy / (xiw_energy + np.finfo(np.float64).eps))
+    x = x[..., win_len // 2: - win_len // 2]
+    ow = ow[win_len // 2: - win_len // 2]
 
-        x[win_pos[i]: win_pos[i] + win_len] += xiw
+    if out is None:
+        x /= ow
+        return x
 
-        ow[win_pos[i]: win_pos[i] + win_len] += np.power(w, 2)
+    n = min(out.shape[-1], x.shape[-1])
+    np.divide(x[..., :n], ow[:n], out=out[..., :n])
+    out[..., n:] = 0
 
-    ow[ow < 1e-3] = 1
-    x = x / ow
+    return out
+
+
+def _window_sum(win, hop, n_frames, start, end):
+    """Sum of the windows overlap-added with a constant hop size,
+    for the samples from start to end (excluded).
+    Only the frames overlapping the samples are added,
+    in the same order as `_overlap_add` of all frames.
+
+    Parameters
+    ----------
+
+    win : numpy.ndarray [shape=(win_size)]
+          the window function.
+    hop : int > 0 [scalar]
+          the hop size between adjacent frames.
+    n_frames : int > 0 [scalar]
+               the number of frames.
+    start : int >= 0 [scalar]
+            the first sample of the sum.
+    end : int >= 0 [scalar]
+          the sample after the last sample of the sum.
+
+    Returns
+    -------
+
+    ow : numpy.ndarray [shape=(end - start)]
+         the sum of the windows.
+    """
+    ow = np.zeros(max(end - start, 0), dtype=win.dtype)
+
+    first = max(0, -(-(start - win.size + 1) // hop))
+    last = min(n_frames, -(-end // hop))
+    if last > first:
+        frames = np.broadcast_to(win, (last - first, win.size))
+        ow_frames = _overlap_add(frames, hop)
+        pos = first * hop
+        lo = max(pos, start)
+        hi = min(pos + ow_frames.size, end)
+        ow[lo - start: hi - start] = ow_frames[lo - pos: hi - pos]
+
+    return ow
+
+
+def _frames(x, win_pos, win_size):
+    """Gather the frames of the signal starting at the given positions.
+    The frames are taken from a strided view of the signal,
+    so only the gathered frame matrix is allocated.
+    The samples outside the signal are zeros,
+    so the signal does not need to be padded.
+
+    Parameters
+    ----------
+
+    x : numpy.ndarray [shape=(channel, num_samples) or (num_samples)]
+        the input audio sequence.
+    win_pos : numpy.ndarray [shape=(num_frames)]
+              start position of each frame. It can be negative.
+    win_size : int > 0 [scalar]
+               length of each frame.
+
+    Returns
+    -------
+
+    frames : numpy.ndarray [shape=(channel, num_frames, win_size) \
+                            or (num_frames, win_size)]
+             the gathered frames.
+    """
+    win_pos = np.asarray(win_pos)
+    inside = (win_pos >= 0) & (win_pos + win_size <= x.shape[-1])
+    if np.all(inside):
+        return sliding_window_view(x, win_size, axis=-1)[..., win_pos, :]
+
+    frames = np.zeros(x.shape[:-1] + (win_pos.size, win_size), dtype=x.dtype)
+    if x.shape[-1] >= win_size:
+        frames[..., inside, :] = sliding_window_view(
+            x, win_size, axis=-1)[..., win_pos[inside], :]
+
+    # only the frames at the edges of the signal are partially filled.
+    for i in np.flatnonzero(~inside):
+        lo = max(win_pos[i], 0)
+        hi = min(win_pos[i] + win_size, x.shape[-1])
+        if hi > lo:
+            frames[..., i, lo - win_pos[i]: hi - win_pos[i]] = x[..., lo: hi]
+
+    return frames
+
+
+def _analyze_frames(frames, win, fft_shift):
+    """Window the frames and transform them to the spectra.
+
+    Parameters
+    ----------
+
+    frames : numpy.ndarray [shape=(..., num_frames, win_size)]
+             the frames of the audio sequence.
+    win : numpy.ndarray [shape=(win_size)]
+          the window function.
+    fft_shift : bool
+                apply circular shift to the frames.
+
+    Returns
+    -------
+
+    spec : numpy.ndarray [shape=(..., num_frames, win_size // 2 + 1)]
+           the spectrum of each frame.
+    """
+    frames = frames * win
+
+    if fft_shift:
+        frames = np.roll(frames, -(win.size // 2), axis=-1)
+
+    # the frames are split across the threads by scipy.
+    return fft.rfft(frames, axis=-1, workers=get_num_threads())
+
+
+def _synthesize_frames(spec, win, fft_shift, restore_energy):
+    """Transform the spectra to the windowed frames for overlap-add.
+
+    Parameters
+    ----------
+
+    spec : numpy.ndarray [shape=(..., num_frames, num_bins)]
+           the spectrum of each frame.
+    win : numpy.ndarray [shape=(2 * (num_bins - 1))]
+          the window function.
+    fft_shift : bool
+                apply circular shift to the frames.
+    restore_energy : bool
+                     tries to reserve potential energy loss.
+
+    Returns
+    -------
+
+    frames : numpy.ndarray [shape=(..., num_frames, 2 * (num_bins - 1))]
+             the windowed frames.
+    """
+    xi = fft.irfft(spec, n=2 * (spec.shape[-1] - 1), axis=-1,
+                   workers=get_num_threads())
+    if fft_shift:
+        xi = fft.fftshift(xi, axes=-1)
+
+    xiw = xi * win
+
+    if restore_energy:
+        xi_energy = np.sum(abs(xi), axis=-1, keepdims=True)
+        xiw_energy = np.sum(abs(xiw), axis=-1, keepdims=True)
+        xiw = xiw * (xi_energy / (xiw_energy + np.finfo(xiw.dtype).eps))
+
+    return xiw
+
+
+def _overlap_add(frames, hop):
+    """Overlap-add the frames with a constant hop size.
+    Each frame is split into hop-sized segments,
+    and the segments at the same offset of all frames are added at once.
+
+    Parameters
+    ----------
+
+    frames : numpy.ndarray [shape=(channel, num_frames, frame_size) \
+                            or (num_frames, frame_size)]
+             the frames to overlap-add.
+    hop : int > 0 [scalar]
+          the hop size between adjacent frames.
+
+    Returns
+    -------
+
+    y : numpy.ndarray [shape=(channel, (num_frames - 1) * hop + frame_size) \
+                       or ((num_frames - 1) * hop + frame_size)]
+        the overlap-added sequence.
+    """
+    n_frames, frame_size = frames.shape[-2:]
+    n_seg = -(-frame_size // hop)
+
+    y = np.zeros(frames.shape[:-2] + (n_frames + n_seg - 1, hop),
+                 dtype=frames.dtype)
+    for j in range(n_seg):
+        seg = frames[..., j * hop: (j + 1) * hop]
+        y[..., j: j + n_frames, : seg.shape[-1]] += seg
 
-    x = x[win_len // 2: - win_len // 2]
+    y = y.reshape(frames.shape[:-2] + (-1,))
 
-    return x
+    return y[..., : (n_frames - 1) * hop + frame_size]
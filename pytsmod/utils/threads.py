@@ -0,0 +1,145 @@
+import os
+import numbers
+import contextlib
+import contextvars
+import functools
+import threading
+from concurrent import futures
+
+
+__all__ = ['set_num_threads', 'get_num_threads', 'num_threads']
+
+_num_threads = 1
+_context_threads = contextvars.ContextVar('pytsmod_num_threads',
+                                          default=None)
+_pool = None
+_pool_size = 0
+_pool_users = {}
+_pool_lock = threading.Lock()
+_local = threading.local()
+
+
+def set_num_threads(n):
+    """Set the number of threads used by pytsmod.
+    The FFTs of the frames are split across the threads,
+    and independent channels and blocks are processed in a shared thread pool.
+    The results do not depend on the number of threads.
+
+    Parameters
+    ----------
+
+    n : int > 0 [scalar] or None
+        the number of threads. None uses the number of CPUs.
+        1 processes everything in the calling thread.
+    """
+    global _num_threads
+
+    _num_threads = _check_num_threads(n)
+
+
+def get_num_threads():
+    """Get the number of threads used by pytsmod.
+
+    Returns
+    -------
+
+    n : int > 0 [scalar]
+        the number of threads, set by `num_threads` in the current context
+        or by `set_num_threads` otherwise.
+    """
+    n = _context_threads.get()
+    return _num_threads if n is None else n
+
+
+@contextlib.contextmanager
+def num_threads(n):
+    """Context manager to set the number of threads used by pytsmod
+    in the current thread or asyncio task, and restore it at the exit.
+    The other threads keep the number set by `set_num_threads`.
+
+    Parameters
+    ----------
+
+    n : int > 0 [scalar] or None
+        the number of threads. None uses the number of CPUs.
+    """
+    token = _context_threads.set(_check_num_threads(n))
+    try:
+        yield
+    finally:
+        _context_threads.reset(token)
+
+
+def _check_num_threads(n):
+    if n is None:
+        n = os.cpu_count()
+    if isinstance(n, bool) or not isinstance(n, numbers.Integral) or n < 1:
+        raise Exception("Please use the valid number of threads. "
+                        + "(integer larger than 0 or None)")
+
+    return int(n)
+
+
+def _thread_map(func, *iterables):
+    """Apply the function to the items in the shared thread pool.
+
+    The results are returned in the order of the items.
+    Calls from a thread of the pool are run in place,
+    so that nested calls do not wait for each other.
+
+    Parameters
+    ----------
+
+    func : callable
+           the function to apply.
+    iterables : iterable
+                the arguments of each call.
+
+    Returns
+    -------
+
+    results : list
+              the result of each call.
+    """
+    n = get_num_threads()
+    if n == 1 or getattr(_local, 'in_pool', False):
+        return list(map(func, *iterables))
+
+    # the calls see the number of threads of the caller's context.
+    ctx = contextvars.copy_context()
+    with _use_pool(n) as pool:
+        return list(pool.map(functools.partial(_run_in_pool, ctx, func),
+                             *iterables))
+
+
+def _run_in_pool(ctx, func, *args):
+    _local.in_pool = True
+    return ctx.copy().run(func, *args)
+
+
+@contextlib.contextmanager
+def _use_pool(n):
+    # the pool is created again only when the number of threads changes.
+    # A replaced pool is shut down once the last caller using it is done,
+    # so that no call is submitted to a pool which is shut down.
+    global _pool, _pool_size
+
+    with _pool_lock:
+        if _pool is None or _pool_size != n:
+            if _pool is not None and not _pool_users.get(_pool):
+                _pool.shutdown(wait=False)
+            _pool = futures.ThreadPoolExecutor(
+                max_workers=n, thread_name_prefix='pytsmod')
+            _pool_size = n
+        pool = _pool
+        _pool_users[pool] = _pool_users.get(pool, 0) + 1
+
+    try:
+        yield pool
+    finally:
+        with _pool_lock:
+            _pool_users[pool] -= 1
+            if not _pool_users[pool]:
+                del _pool_users[pool]
+                if pool is not _pool:
+                    pool.shutdown(wait=False)
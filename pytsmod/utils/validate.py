@@ -2,8 +2,9 @@ import numpy as np
 from warnings import warn
 
 
-def _validate_audio(audio):
+def _validate_audio(audio, channel_axis=None):
     """validate the input audio and modify the order of channels.
+    The input is never copied, the channels are moved with a view.
 
     Parameters
     ----------
@@ -11,6 +12,11 @@ def _validate_audio(audio):
     audio : numpy.ndarray [shape=(channel, num_samples) or (num_samples)\
                            or (num_samples, channel)]
             the input audio sequence to validate.
+    channel_axis : int or None
+                   the axis of the channels of a 2-D input.
+                   0 for (channel, num_samples), 1 or -1 for
+                   (num_samples, channel) such as the output of soundfile.
+                   None guesses it from the shape with a warning.
 
     Returns
     -------
@@ -18,11 +24,18 @@ def _validate_audio(audio):
     audio : numpy.ndarray [shape=(channel, num_samples)]
             the validataed output audio sequence.
     """
+    if channel_axis not in (None, 0, 1, -1):
+        raise Exception("Please use the valid channel axis. "
+                        + "(0, 1, -1 or None)")
+
     if audio.ndim == 1:
         audio = np.expand_dims(audio, 0)
     elif audio.ndim > 2:
         raise Exception("Please use the valid audio source. "
                         + "Number of dimension of input should be less than 3.")
+    elif channel_axis is not None:
+        if _channels_last(channel_axis):
+            audio = audio.T
     elif audio.shape[0] > audio.shape[1]:
         warn('it seems that the 2nd axis of the input audio source '
              + 'is a channel. it is recommended that fix channel '
@@ -117,3 +130,77 @@ def _validate_f0(audio, f0):
                         + "should be less than 3.")
 
     return f0
+
+
+def _validate_out(out, n_chan, length, dtype, channel_axis=None):
+    """Validate the output array given by the user.
+
+    Parameters
+    ----------
+
+    out : numpy.ndarray [shape=(channel, num_samples) or (num_samples)] \
+          or None
+          the output array to write the result to.
+    n_chan : int > 0 [scalar]
+             number of channels of the output.
+    length : int > 0 [scalar]
+             number of samples of the output.
+    dtype : numpy.dtype
+            floating point type of the output.
+    channel_axis : int or None
+                   the axis of the channels of out, as in `_validate_audio`.
+                   With 1 or -1, a new array has interleaved channels.
+
+    Returns
+    -------
+
+    y : numpy.ndarray [shape=(channel, num_samples)]
+        a view of out with the channel axis,
+        or a new array filled with zeros if out is None.
+    """
+    last = _channels_last(channel_axis)
+    if out is None:
+        if last:
+            return np.zeros((length, n_chan), dtype=dtype).T
+        return np.zeros((n_chan, length), dtype=dtype)
+
+    if out.ndim == 1 and n_chan == 1:
+        y = out[np.newaxis]
+    else:
+        y = out.T if last else out
+    if y.shape != (n_chan, length) or y.dtype != np.dtype(dtype):
+        shape = (length, n_chan) if last else (n_chan, length)
+        raise Exception("Please use the valid output array. "
+                        + f"(shape {shape} "
+                        + f"or ({length}) for a single channel, "
+                        + f"dtype {np.dtype(dtype)})")
+
+    return y
+
+
+def _to_channel_axis(y, channel_axis):
+    """Move the channels of an array between the first axis
+    and the channel axis of the input. Only a view is made.
+
+    Parameters
+    ----------
+
+    y : numpy.ndarray [shape=(channel, num_samples) or (num_samples)]
+        the output audio sequence.
+    channel_axis : int or None
+                   the axis of the channels of the input.
+
+    Returns
+    -------
+
+    y : numpy.ndarray [shape=(channel, num_samples) or (num_samples) \
+                       or (num_samples, channel)]
+        the output audio sequence with the channels at channel_axis.
+    """
+    if _channels_last(channel_axis) and y.ndim == 2:
+        return y.T
+    return y
+
+
+def _channels_last(channel_axis):
+    return channel_axis in (1, -1)
@@ -1,9 +1,14 @@
+from functools import lru_cache
+
 import numpy as np
 
 
-def win(win_type='hann', win_size=4096, zero_pad=0):
+def win(win_type='hann', win_size=4096, zero_pad=0, dtype=np.float64):
     """Generate diverse type of window function
 
+    Windows are cached, so repeated calls with the same arguments return
+    the same read-only array. Copy it before modifying it in place.
+
     Parameters
     ----------
 
@@ -17,6 +22,8 @@ def win(win_type='hann', win_size=4096, zero_pad=0):
                the total length of zero-pad.
                Zeros are equally distributed
                for both left and right of the window.
+    dtype : numpy.dtype
+            floating point type of the window function.
 
     Returns
     -------
@@ -25,6 +32,11 @@ def win(win_type='hann', win_size=4096, zero_pad=0):
           the window function generated.
     """
 
+    return _cached_win(win_type, win_size, zero_pad, np.dtype(dtype))
+
+
+@lru_cache(maxsize=256)
+def _cached_win(win_type, win_size, zero_pad, dtype=np.dtype(np.float64)):
     if win_type == 'hann':
         win = np.hanning(win_size)
     elif win_type == 'sin':
@@ -32,6 +44,16 @@ def win(win_type='hann', win_size=4096, zero_pad=0):
     else:
         raise Exception("Please use the valid window type. (hann, sin)")
 
-    win = np.pad(win, zero_pad // 2, 'constant')
+    win = np.pad(win, zero_pad // 2, 'constant').astype(dtype)
+    win.flags.writeable = False
 
     return win
+
+
+@lru_cache(maxsize=32)
+def _squared_win(win_type, win_size, zero_pad, dtype=np.dtype(np.float64)):
+    """Squared window for the window-sum normalization of LSEE-MSTFT."""
+    win_sq = np.power(_cached_win(win_type, win_size, zero_pad, dtype), 2)
+    win_sq.flags.writeable = False
+
+    return win_sq
@@ -1,11 +1,19 @@
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view, as_strided
+from scipy import fft
 from scipy.interpolate import interp1d
 from .utils import win as win_func
 from .utils import _validate_audio, _validate_scale_factor
+from .utils.validate import _validate_out, _to_channel_axis
+from .utils.stft import _frames
+from .utils.profiling import _profiled
 
 
+@_profiled('wsola')
 def wsola(x, s, win_type='hann',
-          win_size=1024, syn_hop_size=512, tolerance=512):
+          win_size=1024, syn_hop_size=512, tolerance=512, xcorr='auto',
+          search_decimation=1, dtype=np.float64, out=None,
+          channel_axis=None):
     """Modify length of the audio sequence using WSOLA algorithm.
 
     Parameters
@@ -30,6 +38,30 @@ def wsola(x, s, win_type='hann',
                 in the input signal may be shifted
                 to avoid phase discontinuities when overlap-adding them
                 to form the output signal (given in samples).
+    xcorr : str
+            method of the cross-correlation for the similarity search.
+            direct, fft and auto are available.
+            auto chooses the faster one for the window size and the tolerance.
+    search_decimation : int > 0 [scalar]
+                        decimation factor of the coarse-to-fine search.
+                        The best shift is first searched on the signals
+                        decimated by this factor, and then refined
+                        around it at the full rate.
+                        For music, the correlation of the shifts found is
+                        on average within 2% of the full search
+                        up to the decimation of 8.
+                        1 searches every shift at the full rate.
+    dtype : numpy.dtype
+            floating point type of the computation.
+    out : numpy.ndarray [shape=(channel, num_samples) or (num_samples)]
+          the array to write the output to, with the shape of the output
+          and the given dtype. It can be reused across the calls.
+    channel_axis : int or None
+                   the axis of the channels of a 2-D input and the output.
+                   0 for (channel, num_samples), 1 or -1 for
+                   (num_samples, channel) such as the output of soundfile,
+                   which is used through a view without copying.
+                   None guesses it from the shape.
 
     Returns
     -------
@@ -38,67 +70,531 @@ def wsola(x, s, win_type='hann',
         the modified output audio sequence.
     """
     # validate the input audio and scale factor.
-    x = _validate_audio(x)
+    # the input is converted frame by frame, so that a long input
+    # such as numpy.memmap is not copied as a whole.
+    x = _validate_audio(x, channel_axis)
     anc_points = _validate_scale_factor(x, s)
 
     n_chan = x.shape[0]
     output_length = int(anc_points[-1, -1]) + 1
 
-    win = win_func(win_type=win_type, win_size=win_size, zero_pad=0)
+    win = win_func(win_type=win_type, win_size=win_size, zero_pad=0,
+                   dtype=dtype)
 
     sw_pos = np.arange(0, output_length + win_size // 2, syn_hop_size)
     ana_interpolated = interp1d(anc_points[1, :], anc_points[0, :],
                                 fill_value='extrapolate')
     aw_pos = np.round(ana_interpolated(sw_pos)).astype(int)
-    ana_hop = np.insert(aw_pos[1:] - aw_pos[0: -1], 0, 0)
 
-    y = np.zeros((n_chan, output_length))
+    # the frames are taken from the input as if it was padded with zeros,
+    # so that the first window is centered at the first sample.
+    # frames outside the input are filled with zeros instead of copying
+    # the whole input with the padding.
+    aw_pos = aw_pos - win_size // 2
 
-    min_fac = np.min(syn_hop_size / ana_hop[1:])
+    n_fft = _fft_size(win_size, tolerance, xcorr, search_decimation)
 
-    # padding the input audio sequence.
-    left_pad = int(win_size // 2 + tolerance)
-    right_pad = int(np.ceil(1 / min_fac) * win_size + tolerance)
-    x_padded = np.pad(x, ((0, 0), (left_pad, right_pad)), 'constant')
+    # Applying WSOLA to all channels at once.
+    # Window positions and the normalizer are shared by the channels,
+    # only the offset delta is tracked for each channel.
+    # The frames are added to the output directly,
+    # cut at the edges of the output.
+    y = _validate_out(out, n_chan, output_length, dtype, channel_axis)
+    y.fill(0)
+    sw_pos = (sw_pos - win_size // 2).tolist()
 
-    aw_pos = aw_pos + tolerance
+    # the frames are read from strided views of the input,
+    # except near the edges where they may reach outside of it.
+    search_size = win_size + 2 * tolerance
+    inside = ((aw_pos - tolerance >= 0)
+              & (aw_pos + syn_hop_size + tolerance + win_size <= x.shape[-1]))
+    inside_next = ((aw_pos - tolerance >= 0)
+                   & (aw_pos + win_size + tolerance <= x.shape[-1]))
+    if np.any(inside_next):
+        x_frames = sliding_window_view(x, win_size, axis=-1)
+        x_search = sliding_window_view(x, search_size, axis=-1)
 
-    # Applying WSOLA to each channels
-    for c, x_chan in enumerate(x_padded):
-        y_chan = np.zeros(output_length + 2 * win_size)
-        ow = np.zeros(output_length + 2 * win_size)
+    chan = np.arange(n_chan)
+    delta = np.zeros(n_chan, dtype=int)
 
-        delta = 0
+    for i in range(len(aw_pos) - 1):
+        if inside[i]:
+            x_adj = x_frames[chan, aw_pos[i] + delta]
+            nat_prog = x_frames[chan, aw_pos[i] + delta + syn_hop_size]
+        else:
+            x_adj = _channel_frames(x, aw_pos[i] + delta, win_size)
+            nat_prog = _channel_frames(x, aw_pos[i] + delta + syn_hop_size,
+                                       win_size)
+        _add_frame(y, x_adj.astype(dtype, copy=False), win, sw_pos[i])
 
-        for i in range(len(aw_pos) - 1):
-            x_adj = x_chan[aw_pos[i] + delta: aw_pos[i] + win_size + delta]
-            y_chan[sw_pos[i]: sw_pos[i] + win_size] += x_adj * win
-            ow[sw_pos[i]: sw_pos[i] + win_size] += win
+        if inside_next[i + 1]:
+            x_next = x_search[:, aw_pos[i+1] - tolerance]
+        else:
+            x_next = _frames(x, [aw_pos[i+1] - tolerance], search_size)[:, 0]
+        nat_prog = nat_prog.astype(dtype, copy=False)
+        x_next = x_next.astype(dtype, copy=False)
 
-            nat_prog = x_chan[aw_pos[i] + delta + syn_hop_size:
-                              aw_pos[i] + delta + syn_hop_size + win_size]
+        delta = _search(nat_prog, x_next, tolerance, n_fft, search_decimation)
 
-            next_aw_range = np.arange(aw_pos[i+1] - tolerance,
-                                      aw_pos[i+1] + win_size + tolerance)
+    # Calculate last frame
+    x_adj = _channel_frames(x, aw_pos[-1] + delta, win_size)
+    _add_frame(y, x_adj.astype(dtype, copy=False), win, sw_pos[-1])
 
-            x_next = x_chan[next_aw_range]
+    _normalize(y, win, sw_pos)
 
-            cross_corr = np.correlate(nat_prog, x_next)
-            max_index = np.argmax(cross_corr)
+    if out is None:
+        return _to_channel_axis(y.squeeze(), channel_axis)
+    return out
 
-            delta = tolerance - max_index
 
-        # Calculate last frame
-        x_adj = x_chan[aw_pos[-1] + delta: aw_pos[-1] + win_size + delta]
-        y_chan[sw_pos[-1]: sw_pos[-1] + win_size] += x_adj * win
-        ow[sw_pos[-1]: sw_pos[-1] + win_size] += + win
+class WSOLAStream:
+    """Stream version of WSOLA for a constant time stretching factor.
+    The input is given block by block with `process`,
+    and the remaining output is returned by `flush` at the end of the input.
+    Only the samples needed for the next frames are buffered,
+    so the memory usage does not depend on the length of the input.
 
+    Parameters
+    ----------
+
+    alpha : number > 0 [scalar]
+            the time stretching factor.
+    n_chan : int > 0 [scalar]
+             number of channels of the input audio sequence.
+    win_type : str
+               type of the window function. hann and sin are available.
+    win_size : int > 0 [scalar]
+               size of the window function.
+    syn_hop_size : int > 0 [scalar]
+                   hop size of the synthesis window.
+                   Usually half of the window size.
+    tolerance : int >= 0 [scalar]
+                number of samples the window positions
+                in the input signal may be shifted
+                to avoid phase discontinuities when overlap-adding them
+                to form the output signal (given in samples).
+    xcorr : str
+            method of the cross-correlation for the similarity search.
+            direct, fft and auto are available.
+    search_decimation : int > 0 [scalar]
+                        decimation factor of the coarse-to-fine search.
+                        See `wsola`.
+    length : int > 0 [scalar] or None
+             total number of samples of the input, if known.
+             When it is given, the output is the same as
+             `wsola(x, alpha)` of the whole input.
+             Otherwise, the window positions follow 1 / alpha exactly.
+    dtype : numpy.dtype
+            floating point type of the computation.
+    channel_axis : int
+                   the axis of the channels of the blocks and the output.
+                   0 for (channel, num_samples), 1 or -1 for
+                   (num_samples, channel) such as the blocks of soundfile.
+
+    Attributes
+    ----------
+
+    latency : int >= 0 [scalar]
+              maximum number of output samples held back by the stream.
+              After n input samples are processed,
+              at least ceil(alpha * n) - latency output samples
+              have been returned.
+    """
+    def __init__(self, alpha, n_chan=1, win_type='hann', win_size=1024,
+                 syn_hop_size=512, tolerance=512, xcorr='auto',
+                 search_decimation=1, length=None, dtype=np.float64,
+                 channel_axis=0):
+        if channel_axis not in (0, 1, -1):
+            raise Exception("Please use the valid channel axis. (0, 1 or -1)")
+        if length is None:
+            anc_points = np.array([[0, 1], [0, alpha]])
+        else:
+            anc_points = np.array([[0, length - 1],
+                                   [0, np.ceil(alpha * length) - 1]])
+
+        self.alpha = alpha
+        self.n_chan = n_chan
+        self.win_size = win_size
+        self.syn_hop_size = syn_hop_size
+        self.tolerance = tolerance
+        self.search_decimation = search_decimation
+        self.length = length
+        self.dtype = np.dtype(dtype)
+        self.channel_axis = channel_axis
+        self.latency = int(np.ceil(max(alpha * syn_hop_size, syn_hop_size)
+                                   + alpha * (tolerance + win_size
+                                              - win_size // 2 + 1))
+                           + win_size // 2)
+
+        self._win = win_func(win_type=win_type, win_size=win_size, zero_pad=0,
+                             dtype=self.dtype)
+        self._n_fft = _fft_size(win_size, tolerance, xcorr, search_decimation)
+        self._ana_interpolated = interp1d(anc_points[1, :], anc_points[0, :],
+                                          fill_value='extrapolate')
+
+        # input buffer, starting from the sample _in_start of the padded input.
+        self._in_buf = np.zeros((n_chan, win_size // 2 + tolerance),
+                                dtype=self.dtype)
+        self._in_start = 0
+        self._num_samples = 0
+
+        # output and normalizer buffer, starting from the sample _out_start.
+        self._y = np.zeros((n_chan, 0), dtype=self.dtype)
+        self._ow = np.zeros(0, dtype=self.dtype)
+        self._out_start = 0
+        self._emitted = 0
+
+        self._frame = 0
+        self._delta = np.zeros(n_chan, dtype=int)
+
+    def process(self, x):
+        """Time-stretch a block of the input audio sequence.
+
+        Parameters
+        ----------
+
+        x : numpy.ndarray [shape=(channel, num_samples) or (num_samples)]
+            a block of the input audio sequence.
+
+        Returns
+        -------
+
+        y : numpy.ndarray [shape=(channel, num_samples) or (num_samples)]
+            the output audio sequence which is ready.
+            The number of samples differs for each block,
+            and the channel axis is removed for a single channel.
+        """
+        x = _to_channel_axis(np.asarray(x), self.channel_axis)
+        x_block = np.reshape(x, (self.n_chan, -1)).astype(self.dtype,
+                                                          copy=False)
+        self._in_buf = np.concatenate((self._in_buf, x_block), axis=1)
+        self._num_samples += x_block.shape[1]
+
+        self._run()
+        y = self._emit(self._frame * self.syn_hop_size - self.win_size // 2)
+
+        return _to_channel_axis(y if self.n_chan > 1 else y[0],
+                                self.channel_axis)
+
+    def flush(self):
+        """Process the rest of the input after the last block.
+
+        Returns
+        -------
+
+        y : numpy.ndarray [shape=(channel, num_samples) or (num_samples)]
+            the remaining output audio sequence.
+        """
+        output_length = int(np.ceil(self.alpha * self._num_samples))
+        if self.length is not None:
+            output_length = int(np.ceil(self.alpha * self.length))
+        num_frames = len(range(0, output_length + self.win_size // 2,
+                               self.syn_hop_size))
+
+        # pad zeros after the end of the input.
+        need = self._need(num_frames - 1)
+        in_end = self._in_start + self._in_buf.shape[1]
+        if need > in_end:
+            self._in_buf = np.pad(self._in_buf, ((0, 0), (0, need - in_end)),
+                                  'constant')
+
+        self._run(num_frames)
+        y = self._emit(output_length)
+
+        return _to_channel_axis(y if self.n_chan > 1 else y[0],
+                                self.channel_axis)
+
+    def _aw_pos(self, i):
+        sw_pos = np.arange(i, i + 2) * self.syn_hop_size
+        aw_pos = np.round(self._ana_interpolated(sw_pos)).astype(int)
+        return aw_pos + self.tolerance
+
+    def _need(self, i):
+        # end of the padded input needed to process the frame i.
+        aw_pos = self._aw_pos(i)
+        return (max(aw_pos[0] + self.syn_hop_size, aw_pos[1])
+                + self.tolerance + self.win_size)
+
+    def _run(self, num_frames=None):
+        win_size = self.win_size
+        tolerance = self.tolerance
+        win = self._win
+
+        while num_frames is None or self._frame < num_frames:
+            i = self._frame
+            if self._need(i) > self._in_start + self._in_buf.shape[1]:
+                break
+
+            aw_pos = self._aw_pos(i) - self._in_start
+            sw_pos = i * self.syn_hop_size - self._out_start
+
+            out_end = sw_pos + win_size
+            if out_end > self._ow.size:
+                grow = out_end - self._ow.size
+                self._y = np.pad(self._y, ((0, 0), (0, grow)), 'constant')
+                self._ow = np.pad(self._ow, (0, grow), 'constant')
+
+            x_frames = sliding_window_view(self._in_buf, win_size, axis=-1)
+            chan = np.arange(self.n_chan)
+
+            x_adj = x_frames[chan, aw_pos[0] + self._delta]
+            self._y[:, sw_pos: sw_pos + win_size] += x_adj * win
+            self._ow[sw_pos: sw_pos + win_size] += win
+
+            nat_prog = x_frames[chan, aw_pos[0] + self._delta
+                                + self.syn_hop_size]
+            x_next = self._in_buf[:, aw_pos[1] - tolerance:
+                                  aw_pos[1] + win_size + tolerance]
+
+            self._delta = _search(nat_prog, x_next, tolerance, self._n_fft,
+                                  self.search_decimation)
+            self._frame += 1
+
+            # drop the input which is not needed anymore.
+            drop = aw_pos[1] - tolerance
+            self._in_buf = self._in_buf[:, drop:]
+            self._in_start += drop
+
+    def _emit(self, end):
+        # return the output until the sample end (excluded).
+        start = self._emitted + self.win_size // 2 - self._out_start
+        end = end + self.win_size // 2 - self._out_start
+        if end <= start:
+            return np.zeros((self.n_chan, 0), dtype=self.dtype)
+
+        ow = self._ow[start: end].copy()
         ow[ow < 1e-3] = 1
+        y = self._y[:, start: end] / ow
+
+        self._y = self._y[:, end:]
+        self._ow = self._ow[end:]
+        self._out_start += end
+        self._emitted += end - start
+
+        return y
 
-        y_chan = y_chan / ow
-        y_chan = y_chan[win_size // 2:]
-        y_chan = y_chan[: output_length]
 
-        y[c, :] = y_chan
+def _fft_size(win_size, tolerance, xcorr, decimation=1):
+    """Decide the FFT size of the cross-correlation for the similarity search.
 
-    return y.squeeze()
+    Parameters
+    ----------
+
+    win_size : int > 0 [scalar]
+               size of the window function.
+    tolerance : int >= 0 [scalar]
+                maximum shift of the analysis window.
+    xcorr : str
+            method of the cross-correlation.
+            direct, fft and auto are available.
+    decimation : int > 0 [scalar]
+                 decimation factor of the coarse-to-fine search.
+                 The FFT size is decided for the decimated signals.
+
+    Returns
+    -------
+
+    n_fft : int > 0 [scalar] or None
+            the FFT size, or None for the direct cross-correlation.
+    """
+    if not (isinstance(decimation, (int, np.integer)) and decimation >= 1):
+        raise Exception("Please use the valid search decimation. "
+                        + "(integer larger than 0)")
+
+    frame_size = win_size // decimation
+    n_lags = 2 * tolerance // decimation + 1
+    n_fft = fft.next_fast_len(frame_size + n_lags - 1, real=True)
+
+    if xcorr == 'direct':
+        return None
+    elif xcorr == 'fft':
+        return n_fft
+    elif xcorr == 'auto':
+        # the direct method is faster for small tolerances.
+        direct_cost = frame_size * n_lags
+        fft_cost = 30 * n_fft * np.log2(n_fft)
+        return n_fft if direct_cost > fft_cost else None
+    else:
+        raise Exception("Please use the valid cross-correlation method. "
+                        + "(direct, fft, auto)")
+
+
+@_profiled('correlation_search', frames=1)
+def _search(nat_prog, x_next, tolerance, n_fft=None, decimation=1):
+    """Find the offset of the next analysis window for each channel
+    which is the most similar to the natural progression of the current one.
+
+    Parameters
+    ----------
+
+    nat_prog : numpy.ndarray [shape=(channel, win_size)]
+               natural progression of the current analysis window.
+    x_next : numpy.ndarray [shape=(channel, win_size + 2 * tolerance)]
+             the input around the next analysis window.
+    tolerance : int >= 0 [scalar]
+                maximum shift of the next analysis window.
+    n_fft : int > 0 [scalar] or None
+            the FFT size to compute the cross-correlation of all channels
+            at once. If None, the cross-correlation is computed directly.
+    decimation : int > 0 [scalar]
+                 decimation factor of the coarse-to-fine search.
+
+    Returns
+    -------
+
+    delta : numpy.ndarray [shape=(channel)]
+            shift of the next analysis window for each channel.
+    """
+    if decimation == 1:
+        shift = _last_argmax(_cross_corr(nat_prog, x_next, n_fft))
+        return shift - tolerance
+
+    # coarse search on the block sums of the signals.
+    win_size = nat_prog.shape[-1]
+    frame_size = win_size // decimation
+    search_size = frame_size + 2 * tolerance // decimation
+    nat_prog_dec = _decimate(nat_prog, frame_size, decimation)
+    x_next_dec = _decimate(x_next, search_size, decimation)
+    shift = _last_argmax(_cross_corr(nat_prog_dec, x_next_dec, n_fft))
+    shift = shift * decimation
+
+    # refine the shift around the coarse result at the full rate,
+    # for all channels at once.
+    lags = shift[:, np.newaxis] + np.arange(1 - decimation, decimation)
+    lags = np.clip(lags, 0, 2 * tolerance)
+    chan = np.arange(nat_prog.shape[0])[:, np.newaxis]
+    frames = as_strided(x_next, (x_next.shape[0], 2 * tolerance + 1, win_size),
+                        x_next.strides + x_next.strides[-1:], writeable=False)
+    cross_corr = np.matmul(frames[chan, lags],
+                           nat_prog[..., np.newaxis])[..., 0]
+    shift = lags[chan[:, 0], _last_argmax(cross_corr)]
+
+    return shift - tolerance
+
+
+def _decimate(x, length, decimation):
+    # sum every block of the decimation factor.
+    blocks = x[:, : length * decimation].reshape(x.shape[0], length,
+                                                 decimation)
+    return np.matmul(blocks, np.ones(decimation, dtype=x.dtype))
+
+
+def _cross_corr(nat_prog, x_next, n_fft=None):
+    """Compute the cross-correlation between the natural progression
+    and every shift of the next analysis window.
+
+    Parameters
+    ----------
+
+    nat_prog : numpy.ndarray [shape=(channel, frame_size)]
+               natural progression of the current analysis window.
+    x_next : numpy.ndarray [shape=(channel, frame_size + num_lags - 1)]
+             the input around the next analysis window.
+    n_fft : int > 0 [scalar] or None
+            the FFT size, or None for the direct cross-correlation.
+
+    Returns
+    -------
+
+    cross_corr : numpy.ndarray [shape=(channel, num_lags)]
+                 the cross-correlation for each shift.
+    """
+    n_lags = x_next.shape[-1] - nat_prog.shape[-1] + 1
+
+    if n_fft is not None:
+        cross_corr = fft.irfft(fft.rfft(x_next, n_fft, axis=-1)
+                               * np.conj(fft.rfft(nat_prog, n_fft, axis=-1)),
+                               n_fft, axis=-1)
+        return cross_corr[:, : n_lags]
+
+    return np.stack([np.correlate(x_next[c], nat_prog[c])
+                     for c in range(nat_prog.shape[0])])
+
+
+def _last_argmax(cross_corr):
+    # the largest shift is taken among the ties.
+    n_lags = cross_corr.shape[-1]
+    return n_lags - 1 - np.argmax(cross_corr[:, :: -1], axis=-1)
+
+
+def _channel_frames(x, pos, size):
+    """Gather one frame of each channel, starting at its own position.
+    The samples outside the signal are zeros.
+
+    Parameters
+    ----------
+
+    x : numpy.ndarray [shape=(channel, num_samples)]
+        the input audio sequence.
+    pos : numpy.ndarray [shape=(channel)]
+          start position of the frame of each channel.
+    size : int > 0 [scalar]
+           length of the frames.
+
+    Returns
+    -------
+
+    frames : numpy.ndarray [shape=(channel, size)]
+             the gathered frames.
+    """
+    return np.stack([_frames(x[c], [p], size)[0] for c, p in enumerate(pos)])
+
+
+def _add_frame(y, frame, win, pos):
+    """Overlap-add the windowed frame of each channel at the position,
+    cut at the edges of the output.
+
+    Parameters
+    ----------
+
+    y : numpy.ndarray [shape=(channel, num_samples)]
+        the output to add the frames to.
+    frame : numpy.ndarray [shape=(channel, win_size)]
+            the frame of each channel.
+    win : numpy.ndarray [shape=(win_size)]
+          the window function.
+    pos : int [scalar]
+          position of the first sample of the frames in the output.
+    """
+    lo = max(pos, 0)
+    hi = min(pos + win.size, y.shape[-1])
+    if hi > lo:
+        y[:, lo: hi] += frame[:, lo - pos: hi - pos] * win[lo - pos: hi - pos]
+
+
+@_profiled('normalization')
+def _normalize(y, win, pos, block_size=65536):
+    """Divide the output by the sum of the windows added to it.
+    The sum only depends on the window positions,
+    so it is computed for a block of the output at a time
+    instead of being kept for the whole output.
+
+    Parameters
+    ----------
+
+    y : numpy.ndarray [shape=(channel, num_samples)]
+        the overlap-added output, normalized in place.
+    win : numpy.ndarray [shape=(win_size)]
+          the window function.
+    pos : list of int
+          position of the first sample of each window in the output,
+          in increasing order.
+    block_size : int > 0 [scalar]
+                 number of samples normalized at once.
+    """
+    first = 0
+    for start in range(0, y.shape[-1], block_size):
+        end = min(start + block_size, y.shape[-1])
+        while first < len(pos) and pos[first] + win.size <= start:
+            first += 1
+
+        ow = np.zeros(end - start, dtype=win.dtype)
+        for p in pos[first:]:
+            if p >= end:
+                break
+            lo = max(p, start)
+            hi = min(p + win.size, end)
+            ow[lo - start: hi - start] += win[lo - p: hi - p]
+
+        ow[ow < 1e-3] = 1
+        y[:, start: end] /= ow
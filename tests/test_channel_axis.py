@@ -0,0 +1,89 @@
+import pytest
+import pytsmod as tsm
+import numpy as np
+import soundfile as sf
+
+
+def _tdpsola(x, **kwargs):
+    sr = 22050
+    t = np.arange(80000) / sr
+    f0 = 150 + 40 * np.sin(2 * np.pi * 0.7 * t[::220])
+    return tsm.tdpsola(x, sr, np.stack([f0, f0]), alpha=1.3, beta=1.2,
+                       p_hop_size=220, p_win_size=1024, **kwargs)
+
+
+@pytest.mark.parametrize('func', [
+    lambda x, **kwargs: tsm.wsola(x, 1.3, **kwargs),
+    lambda x, **kwargs: tsm.ola(x, 0.8, **kwargs),
+    lambda x, **kwargs: tsm.phase_vocoder(x, 1.3, phase_lock=True, **kwargs),
+    lambda x, **kwargs: tsm.phase_vocoder_int(x, 2, **kwargs),
+    lambda x, **kwargs: tsm.hptsm(x, 1.3, **kwargs),
+    lambda x, **kwargs: tsm.parallel.process(x, 1.3, chunk_seconds=1,
+                                             sr=22050, **kwargs),
+    _tdpsola,
+])
+def test_channel_axis(func):
+    x, _ = sf.read('tests/data/castanetsviolin.wav')
+    x = np.stack([x[:80000], np.roll(x[:80000], 37)])
+
+    y_ref = func(x, channel_axis=0)
+
+    # interleaved samples give interleaved output, with the same values.
+    x_last = np.ascontiguousarray(x.T)
+    y = func(x_last, channel_axis=-1)
+    assert y.shape == y_ref.T.shape
+    assert np.allclose(y, y_ref.T)
+
+
+@pytest.mark.parametrize('func', [
+    lambda x, **kwargs: tsm.wsola(x, 1.3, **kwargs),
+    lambda x, **kwargs: tsm.phase_vocoder(x, 1.3, **kwargs),
+    _tdpsola,
+])
+def test_channel_axis_out(func):
+    x, _ = sf.read('tests/data/castanetsviolin.wav')
+    x = np.stack([x[:80000], np.roll(x[:80000], 37)])
+
+    y_ref = func(x, channel_axis=0)
+
+    # a new output is interleaved, and out is filled in its layout.
+    y = func(x.T, channel_axis=1)
+    assert y.flags.c_contiguous
+    out = np.empty_like(y)
+    assert func(x.T, channel_axis=1, out=out) is out
+    assert np.allclose(out, y_ref.T)
+
+    with pytest.raises(Exception):
+        func(x.T, channel_axis=1, out=np.empty_like(y_ref))
+
+
+def test_channel_axis_short():
+    x, _ = sf.read('tests/data/castanetsviolin.wav')
+    x = np.stack([x[:80000], np.roll(x[:80000], 37)])
+
+    # a clip shorter than its number of channels is not transposed.
+    x_short = np.tile(x[:, :4], (8, 1))
+    with pytest.warns(UserWarning):
+        tsm.wsola(x_short, 1.3)
+    y = tsm.wsola(x_short, 1.3, channel_axis=0)
+    assert y.shape == (16, int(np.ceil(4 * 1.3)))
+
+    with pytest.raises(Exception):
+        tsm.wsola(x, 1.3, channel_axis=2)
+
+
+@pytest.mark.parametrize('stream', [
+    lambda **kwargs: tsm.WSOLAStream(1.3, n_chan=2, **kwargs),
+    lambda **kwargs: tsm.PhaseVocoderStream(1.3, n_chan=2, **kwargs),
+])
+def test_channel_axis_stream(stream):
+    x, _ = sf.read('tests/data/castanetsviolin.wav')
+    x = np.stack([x[:80000], np.roll(x[:80000], 37)])
+
+    s_first = stream()
+    s_last = stream(channel_axis=-1)
+    for pos in range(0, x.shape[-1], 5000):
+        block = x[:, pos: pos + 5000]
+        assert np.array_equal(s_last.process(block.T),
+                              s_first.process(block).T)
+    assert np.array_equal(s_last.flush(), s_first.flush().T)
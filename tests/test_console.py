@@ -6,6 +6,7 @@ import soundfile as sf
 import numpy as np
 import os
 from subprocess import call
+from pytsmod.console.batch import load_jobs, _process_job
 
 
 @pytest.mark.parametrize('algorithm', ['ola', 'wsola', 'pv', 'pv_int'])
@@ -153,3 +154,63 @@ def test_console_pv_int(alpha, win_type, win_size, syn_hop_size, zero_pad,
     os.remove('temp_cli.wav')
 
     assert np.allclose(y_, y_cli)
+
+
+def test_console_batch(tmp_path):
+    test_file = 'tests/data/castanetsviolin.wav'
+    x, sr = sf.read(test_file)
+
+    manifest = tmp_path / 'manifest.csv'
+    manifest.write_text(
+        'input,output,algorithm,alpha,params\n'
+        + f'{test_file},{tmp_path}/ola.wav,ola,1.25,\n'
+        + f'{test_file},{tmp_path}/pv.wav,pv,0.8,"{{""phase_lock"": true}}"\n'
+        + f'missing.wav,{tmp_path}/missing.wav,ola,1.25,\n'
+        + f'{test_file},,ola,1.25,\n'
+        + f'{test_file},{test_file},ola,1.25,\n'
+        + f'{test_file},{tmp_path}/wsola.wav,,,\n')
+
+    cmd = ['python', 'pytsmod/console/console.py', 'batch', str(manifest),
+           '--alpha', '2', '-j', '2', '-r', str(tmp_path / 'report.jsonl')]
+    status = call(cmd)
+
+    # the failing files and rows do not stop the others.
+    assert status == 1
+    assert not (tmp_path / 'missing.wav').exists()
+
+    for name, y in [('ola', ola(x, 1.25)),
+                    ('pv', pv(x, 0.8, phase_lock=True)),
+                    ('wsola', wsola(x, 2))]:
+        sf.write(tmp_path / 'temp.wav', y, sr)
+        y_, _ = sf.read(tmp_path / 'temp.wav')
+        y_cli, _ = sf.read(tmp_path / f'{name}.wav')
+        assert np.allclose(y_, y_cli)
+
+    report = (tmp_path / 'report.jsonl').read_text().splitlines()
+    assert len(report) == 6
+    assert sum('"error": null' in line for line in report) == 3
+
+
+def test_console_batch_glob(tmp_path):
+    for d in ['a', 'b']:
+        (tmp_path / 'in' / d).mkdir(parents=True)
+        (tmp_path / 'in' / d / 'x.wav').touch()
+
+    # the subdirectories are kept, so the same names do not collide.
+    jobs = load_jobs(str(tmp_path / 'in' / '**' / '*.wav'),
+                     str(tmp_path / 'out'), {'alpha': 1.3})
+    assert [job['output'] for job in jobs] == [
+        os.path.join(tmp_path, 'out', 'a', 'x.wav'),
+        os.path.join(tmp_path, 'out', 'b', 'x.wav')]
+
+    # the inputs are not overwritten, and the jobs fail one by one.
+    jobs = load_jobs(str(tmp_path / 'in' / '*' / '*.wav'),
+                     str(tmp_path / 'in'), {'alpha': 1.3})
+    manifest = tmp_path / 'manifest.jsonl'
+    path = str(tmp_path / 'in' / 'a' / 'x.wav')
+    manifest.write_text(f'{{"input": "{path}", "output": "{path}"}}\n'
+                        + f'{{"input": "{path}"}}\n')
+    jobs += load_jobs(str(manifest), default={'alpha': 1.3})
+    assert len(jobs) == 4
+    for job in jobs:
+        assert _process_job(job)[1] is not None
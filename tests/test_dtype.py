@@ -0,0 +1,76 @@
+import pytest
+import pytsmod as tsm
+import numpy as np
+import soundfile as sf
+
+
+def _log_spectral_distance(y, y_ref):
+    Y = np.abs(tsm.utils.stft(y, 512))
+    Y_ref = np.abs(tsm.utils.stft(y_ref, 512))
+    return np.mean(np.abs(20 * np.log10((Y + 1e-4) / (Y_ref + 1e-4))))
+
+
+@pytest.fixture(scope='module')
+def x():
+    x, _ = sf.read('tests/data/castanetsviolin.wav', dtype='float32')
+    return np.stack([x[:80000], np.roll(x[:80000], 37)])
+
+
+@pytest.mark.parametrize('func', [
+    lambda x, dtype: tsm.wsola(x, 1.3, dtype=dtype),
+    lambda x, dtype: tsm.ola(x, 0.8, dtype=dtype),
+    lambda x, dtype: tsm.phase_vocoder_int(x, 2, dtype=dtype),
+])
+def test_float32_exact(x, func):
+    y = func(x, np.float32)
+    y_ref = func(x, np.float64)
+
+    assert y.dtype == np.float32
+    assert np.allclose(y, y_ref, atol=1e-5 * np.abs(y_ref).max())
+
+
+@pytest.mark.parametrize('func', [
+    lambda x, dtype: tsm.phase_vocoder(x, 1.3, dtype=dtype),
+    lambda x, dtype: tsm.phase_vocoder(x, 0.8, phase_lock=True, dtype=dtype),
+    lambda x, dtype: tsm.synthesize(tsm.analyze(x, dtype=dtype), 1.3),
+    lambda x, dtype: tsm.hptsm(x, 1.3, dtype=dtype),
+])
+def test_float32_phase(x, func):
+    # the phase is sensitive to the rounding of the phase unwrapping,
+    # so the spectra are compared instead of the samples.
+    y = func(x, np.float32)
+    y_ref = func(x, np.float64)
+
+    assert y.dtype == np.float32
+    assert y.shape == y_ref.shape
+    for c in range(x.shape[0]):
+        assert _log_spectral_distance(y[c], y_ref[c]) < 0.1
+
+
+def test_float32_tdpsola():
+    sr = 22050
+    t = np.arange(int(sr * 1.5)) / sr
+    f0 = 150 + 40 * np.sin(2 * np.pi * 0.7 * t)
+    x = np.sin(2 * np.pi * np.cumsum(f0) / sr).astype(np.float32)
+
+    y = tsm.tdpsola(x, sr, f0[::220], alpha=1.3, beta=1.2, p_hop_size=220,
+                    p_win_size=1024, dtype=np.float32)
+    y_ref = tsm.tdpsola(x, sr, f0[::220], alpha=1.3, beta=1.2, p_hop_size=220,
+                        p_win_size=1024)
+
+    assert y.dtype == np.float32
+    assert np.allclose(y, y_ref, atol=1e-5)
+
+
+@pytest.mark.parametrize('stream', [tsm.WSOLAStream, tsm.PhaseVocoderStream])
+def test_float32_stream(x, stream):
+    y = []
+    for dtype in [np.float32, np.float64]:
+        s = stream(1.3, n_chan=2, length=x.shape[-1], dtype=dtype)
+        y.append(np.concatenate([s.process(x[:, :30000]),
+                                 s.process(x[:, 30000:]), s.flush()], axis=-1))
+
+    assert y[0].dtype == np.float32
+    assert y[0].shape == y[1].shape
+    for c in range(x.shape[0]):
+        assert _log_spectral_distance(y[0][c], y[1][c]) < 0.1
@@ -0,0 +1,73 @@
+import pytest
+import pytsmod as tsm
+import numpy as np
+import soundfile as sf
+
+
+@pytest.mark.parametrize('algo, func, params', [
+    ('ola', tsm.ola, {}),
+    ('wsola', tsm.wsola, {'tolerance': 256}),
+    ('pv', tsm.phase_vocoder, {'phase_lock': True}),
+    ('hptsm', tsm.hptsm, {}),
+])
+@pytest.mark.parametrize('s', [0.8, 1.3])
+def test_process_file(tmp_path, algo, func, params, s):
+    x, sr = sf.read('tests/data/castanetsviolin.wav')
+    x = np.stack([x[:60000], np.roll(x[:60000], 37)])
+    sf.write(tmp_path / 'in.wav', x.T, sr, subtype='DOUBLE')
+
+    # the streamed output is the same as processing the whole file.
+    n = tsm.process_file(tmp_path / 'in.wav', tmp_path / 'out.wav', algo, s,
+                         block_size=5000, subtype='DOUBLE', **params)
+    y, _ = sf.read(tmp_path / 'out.wav')
+    y_ref = func(x, s, **params)
+
+    assert n == y_ref.shape[-1]
+    assert np.allclose(y.T, y_ref)
+
+
+def test_process_file_error(tmp_path):
+    x, sr = sf.read('tests/data/castanetsviolin.wav')
+    sf.write(tmp_path / 'in.wav', x, sr)
+
+    # a failed output is not left behind.
+    with pytest.raises(Exception):
+        tsm.process_file(tmp_path / 'in.wav', tmp_path / 'out.wav', 'wsola',
+                         1.3, win_type='rect')
+    assert not (tmp_path / 'out.wav').exists()
+
+    with pytest.raises(Exception):
+        tsm.process_file(tmp_path / 'in.wav', tmp_path / 'out.wav', 'tdpsola')
+
+
+@pytest.mark.parametrize('algo, func, params', [
+    ('ola', tsm.ola, {}),
+    ('wsola', tsm.wsola, {'tolerance': 256}),
+    ('pv', tsm.phase_vocoder, {'phase_lock': True}),
+])
+@pytest.mark.parametrize('s', [0.8, 'anchor'])
+def test_process_file_mmap(tmp_path, algo, func, params, s):
+    x, sr = sf.read('tests/data/castanetsviolin.wav')
+    x = np.stack([x[:60000], np.roll(x[:60000], 37)])
+    sf.write(tmp_path / 'in.wav', x.T, sr, subtype='FLOAT')
+    x = x.astype(np.float32).astype(np.float64)
+    if s == 'anchor':
+        s = np.array([[0, 20000, 59999], [0, 30000, 70000]])
+
+    # the phase vocoder is run in blocks of frames.
+    n = tsm.process_file(tmp_path / 'in.wav', tmp_path / 'out.wav', algo, s,
+                         block_size=5000, mmap=True, **params)
+    y, _ = sf.read(tmp_path / 'out.wav')
+    y_ref = func(x, s, **params)
+
+    assert n == y_ref.shape[-1]
+    assert np.allclose(y.T, y_ref)
+
+    with pytest.raises(Exception):
+        tsm.process_file(tmp_path / 'in.wav', tmp_path / 'out.wav', 'hptsm',
+                         s, mmap=True)
+
+    sf.write(tmp_path / 'in.wav', x.T, sr, subtype='PCM_16')
+    with pytest.raises(Exception):
+        tsm.process_file(tmp_path / 'in.wav', tmp_path / 'out.wav', algo, s,
+                         mmap=True)
@@ -0,0 +1,54 @@
+import pytest
+import pytsmod as tsm
+import numpy as np
+import soundfile as sf
+from pytsmod.hptsm import _median_filter
+
+
+@pytest.mark.parametrize('n_chan', [2, 3])
+def test_hptsm_multichannel(n_chan):
+    x, _ = sf.read('tests/data/castanetsviolin.wav')
+    x_multi = np.stack([np.roll(x, 100 * c) for c in range(n_chan)])
+
+    y_multi = tsm.hptsm(x_multi, 0.8)
+
+    for c in range(n_chan):
+        assert np.allclose(tsm.hptsm(x_multi[c], 0.8), y_multi[c])
+
+
+@pytest.mark.parametrize('hp_win_size', [1024, 2048])
+def test_hptsm_separation(hp_win_size):
+    x, _ = sf.read('tests/data/castanetsviolin.wav')
+    x = np.stack([x, np.roll(x, 100)])
+
+    separation = tsm.hp_separate(x, hp_win_size=hp_win_size)
+    assert separation.harm.shape == separation.perc.shape == x.shape
+
+    for alpha in [0.8, 1.25]:
+        y = tsm.hptsm(separation, alpha)
+        assert np.array_equal(y, tsm.hptsm(x, alpha, hp_win_size=hp_win_size))
+        assert y.shape == (2, int(np.ceil(alpha * x.shape[-1])))
+
+
+@pytest.mark.parametrize('size', [1, 4, 10, 31])
+@pytest.mark.parametrize('axis', [-1, -2])
+def test_median_filter(size, axis):
+    rng = np.random.default_rng(0)
+    x = rng.random((2, 129, 50))
+
+    assert np.array_equal(_median_filter(x, size, axis, 'numpy'),
+                          _median_filter(x, size, axis, 'scipy'))
+
+    with pytest.raises(Exception):
+        _median_filter(x, size, axis, 'heap')
+
+
+@pytest.mark.parametrize('n', [1, 2, 4, 6])
+def test_median_filter_short(n):
+    # kernels longer than the axis reflect the input more than once.
+    rng = np.random.default_rng(0)
+    x = rng.random((200, n))
+
+    for size in [n + 1, 8 * n, 8 * n + 3, 50]:
+        assert np.array_equal(_median_filter(x, size, -1, 'numpy'),
+                              _median_filter(x, size, -1, 'scipy'))
@@ -0,0 +1,49 @@
+import pytest
+import pytsmod as tsm
+import numpy as np
+import soundfile as sf
+
+
+@pytest.fixture(scope='module')
+def x():
+    x, _ = sf.read('tests/data/castanetsviolin.wav')
+    return np.stack([x[:80000], np.roll(x[:80000], 37)])
+
+
+def _tdpsola(x, out=None):
+    sr = 22050
+    t = np.arange(x.shape[-1]) / sr
+    f0 = 150 + 40 * np.sin(2 * np.pi * 0.7 * t[::220])
+    return tsm.tdpsola(x, sr, np.stack([f0, f0]), alpha=1.3, beta=1.2,
+                       p_hop_size=220, p_win_size=1024, out=out)
+
+
+@pytest.mark.parametrize('func', [
+    lambda x, out=None: tsm.wsola(x, 1.3, out=out),
+    lambda x, out=None: tsm.ola(x, 0.8, out=out),
+    lambda x, out=None: tsm.phase_vocoder(x, 1.3, phase_lock=True, out=out),
+    lambda x, out=None: tsm.synthesize(tsm.analyze(x), 0.8, out=out),
+    lambda x, out=None: tsm.hptsm(x, 1.3, out=out),
+    _tdpsola,
+])
+def test_out(x, func):
+    y_ref = func(x)
+
+    # the output array is overwritten, so it can be reused.
+    out = np.full_like(y_ref, np.nan)
+    for _ in range(2):
+        y = func(x, out=out)
+        assert y is out
+        assert np.array_equal(y, y_ref)
+
+    with pytest.raises(Exception):
+        func(x, out=np.empty((2, y_ref.shape[-1] + 1)))
+    with pytest.raises(Exception):
+        func(x, out=np.empty_like(y_ref, dtype=np.float32))
+
+
+def test_out_mono(x):
+    y_ref = tsm.wsola(x[0], 1.3)
+    out = np.empty(y_ref.size)
+
+    assert np.array_equal(tsm.wsola(x[0], 1.3, out=out), y_ref)
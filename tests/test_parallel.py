@@ -0,0 +1,84 @@
+import pytest
+import pytsmod as tsm
+import numpy as np
+import soundfile as sf
+from pytsmod.parallel import _chunk_layout
+
+
+def _anchor_points(length):
+    return np.array([[0, length // 3, length - 1],
+                     [0, length // 2, int(length * 1.1)]])
+
+
+@pytest.mark.parametrize('s', [1.3, 0.7, 'anchor'])
+def test_parallel_ola(s):
+    x, sr = sf.read('tests/data/castanetsviolin.wav')
+    x = np.stack([x, np.roll(x, 37)])
+
+    if s == 'anchor':
+        s = _anchor_points(x.shape[-1])
+
+    # the chunks are placed on the grid of the synthesis windows,
+    # so the result of OLA is the same as the unchunked one.
+    y = tsm.parallel.process(x, s, algo='ola', n_jobs=2, chunk_seconds=1,
+                             sr=sr)
+    assert np.allclose(y, tsm.ola(x, s))
+
+
+@pytest.mark.parametrize('algo, func', [('wsola', tsm.wsola),
+                                        ('pv', tsm.phase_vocoder),
+                                        ('hptsm', tsm.hptsm)])
+@pytest.mark.parametrize('s', [1.3, 'anchor'])
+def test_parallel_length(algo, func, s):
+    x, sr = sf.read('tests/data/castanetsviolin.wav')
+    x = np.stack([x, np.roll(x, 37)])
+
+    if s == 'anchor':
+        s = _anchor_points(x.shape[-1])
+
+    y_ref = func(x, s)
+    y = tsm.parallel.process(x, s, algo=algo, n_jobs=2, chunk_seconds=1,
+                             sr=sr)
+    assert y.shape == y_ref.shape
+
+    # a single chunk is the unchunked result.
+    y = tsm.parallel.process(x, s, algo=algo, chunk_seconds=10, sr=sr)
+    assert np.array_equal(y, y_ref)
+
+
+@pytest.mark.parametrize('algo, func', [('wsola', tsm.wsola),
+                                        ('pv', tsm.phase_vocoder)])
+def test_parallel_seam_energy(algo, func):
+    x, sr = sf.read('tests/data/castanetsviolin.wav')
+    x = np.stack([x, np.roll(x, 37)])
+
+    y_ref = func(x, 1.3)
+    y = tsm.parallel.process(x, 1.3, algo=algo, n_jobs=2, chunk_seconds=1,
+                             sr=sr)
+
+    # the chunks are not in phase at the seams, and the crossfade
+    # keeps the level of the unchunked result there.
+    anc_points = np.array([[0, x.shape[-1] - 1], [0, y.shape[-1] - 1]])
+    _, _, _, _, seams, fades = _chunk_layout(
+        anc_points, x.shape[-1], y.shape[-1], sr, sr // 4, sr // 40, 512)
+    ratio = [np.sqrt(np.mean(y[:, seam - fade: seam + fade] ** 2)
+                     / np.mean(y_ref[:, seam - fade: seam + fade] ** 2))
+             for seam, fade in zip(seams[1:-1], fades[1:-1])]
+    assert 0.95 < np.mean(ratio) < 1.1
+
+
+def test_parallel_backend():
+    x, sr = sf.read('tests/data/castanetsviolin.wav')
+    x = np.stack([x, np.roll(x, 37)])
+
+    y = tsm.parallel.process(x[0], 0.8, algo='pv', n_jobs=2, chunk_seconds=1,
+                             sr=sr, phase_lock=True)
+    y_proc = tsm.parallel.process(x[0], 0.8, algo='pv', n_jobs=2,
+                                  chunk_seconds=1, sr=sr, phase_lock=True,
+                                  backend='process')
+    assert np.array_equal(y, y_proc)
+
+    with pytest.raises(Exception):
+        tsm.parallel.process(x, 0.8, algo='tdpsola')
+    with pytest.raises(Exception):
+        tsm.parallel.process(x, 0.8, backend='gpu')
@@ -0,0 +1,157 @@
+import pytest
+import pytsmod as tsm
+import numpy as np
+import soundfile as sf
+
+
+@pytest.mark.parametrize('n_chan', [2, 5])
+@pytest.mark.parametrize('phase_lock', [True, False])
+def test_pv_multichannel(n_chan, phase_lock):
+    x, _ = sf.read('tests/data/castanetsviolin.wav')
+    x_multi = np.stack([np.roll(x, 100 * c) for c in range(n_chan)])
+
+    y_multi = tsm.phase_vocoder(x_multi, 1.3, phase_lock=phase_lock)
+
+    for c in range(n_chan):
+        y = tsm.phase_vocoder(x_multi[c], 1.3, phase_lock=phase_lock)
+        assert np.allclose(y, y_multi[c])
+
+
+@pytest.mark.parametrize('n_chan', [2, 5])
+def test_pv_int_multichannel(n_chan):
+    x, _ = sf.read('tests/data/castanetsviolin.wav')
+    x_multi = np.stack([np.roll(x, 100 * c) for c in range(n_chan)])
+
+    y_multi = tsm.phase_vocoder_int(x_multi, 2)
+
+    for c in range(n_chan):
+        assert np.allclose(tsm.phase_vocoder_int(x_multi[c], 2), y_multi[c])
+
+
+@pytest.mark.parametrize('channel_link', ['mid', 'sum'])
+@pytest.mark.parametrize('phase_lock', [True, False])
+def test_pv_channel_link(channel_link, phase_lock):
+    x, _ = sf.read('tests/data/castanetsviolin.wav')
+
+    # identical channels are not affected by the link.
+    y = tsm.phase_vocoder(x, 1.3, phase_lock=phase_lock)
+    y_link = tsm.phase_vocoder(np.stack([x, x]), 1.3, phase_lock=phase_lock,
+                               channel_link=channel_link)
+    assert np.allclose(y_link[0], y)
+    assert np.allclose(y_link[1], y)
+
+    # the relation between the channels is preserved.
+    y_link = tsm.phase_vocoder(np.stack([x, 0.5 * x]), 1.3,
+                               phase_lock=phase_lock,
+                               channel_link=channel_link)
+    assert np.allclose(y_link[1], 0.5 * y_link[0])
+
+
+def test_pv_channel_link_without_phase_lock():
+    x, _ = sf.read('tests/data/castanetsviolin.wav')
+    x_multi = np.stack([x, np.roll(x, 100), np.roll(x, 200)])
+
+    # both modes share the phase of the average spectrum.
+    y_mid = tsm.phase_vocoder(x_multi, 1.3, channel_link='mid')
+    y_sum = tsm.phase_vocoder(x_multi, 1.3, channel_link='sum')
+    assert np.allclose(y_mid, y_sum)
+
+
+def test_find_peaks():
+    from pytsmod.pvtsm import _find_peaks
+    x, _ = sf.read('tests/data/castanetsviolin.wav')
+    mag_spec = np.abs(tsm.utils.stft(x, 1024, 'hann', 2048)).T
+    mag_spec[:5] = 0  # frames without peaks
+
+    peak_idx, has_peak = _find_peaks(mag_spec)
+
+    for frame, idx, found in zip(mag_spec, peak_idx, has_peak):
+        padded = np.pad(frame, 2)
+        p = np.where((padded[4:] < frame) & (padded[3: -1] < frame)
+                     & (padded[1: -3] < frame) & (padded[: -4] < frame))[0]
+        assert found == (p.size > 0)
+        if p.size == 0:
+            continue
+        start = np.append(0, np.ceil((p[1:] + p[: -1]) / 2).astype(int))
+        end = np.append(start[1:], frame.size)
+        expected = np.repeat(p, end - start)
+        assert np.array_equal(idx, expected)
+
+
+@pytest.mark.parametrize('alpha', [0.7, 1.3, 2.5])
+@pytest.mark.parametrize('n_chan', [1, 2])
+@pytest.mark.parametrize('phase_lock', [True, False])
+def test_pv_stream(alpha, n_chan, phase_lock):
+    x, _ = sf.read('tests/data/castanetsviolin.wav')
+    x = np.stack([np.roll(x, 100 * c) for c in range(n_chan)]).squeeze()
+    y = tsm.phase_vocoder(x, alpha, phase_lock=phase_lock)
+
+    stream = tsm.PhaseVocoderStream(alpha, n_chan=n_chan,
+                                    phase_lock=phase_lock,
+                                    length=x.shape[-1])
+    rng = np.random.default_rng(0)
+    y_blocks = []
+    pos = 0
+    while pos < x.shape[-1]:
+        block_size = rng.integers(1, 8000)
+        y_blocks.append(stream.process(x[..., pos: pos + block_size]))
+        pos += block_size
+
+        # the output is held back at most by the latency.
+        num_out = sum(y_block.shape[-1] for y_block in y_blocks)
+        assert (num_out
+                >= np.ceil(alpha * min(pos, x.shape[-1])) - stream.latency)
+    y_blocks.append(stream.flush())
+
+    assert np.allclose(np.concatenate(y_blocks, axis=-1), y)
+
+
+@pytest.mark.parametrize('n_chan', [1, 2])
+def test_pv_analysis_cache(n_chan):
+    x, _ = sf.read('tests/data/castanetsviolin.wav')
+    x = np.stack([np.roll(x, 100 * c) for c in range(n_chan)]).squeeze()
+    analysis = tsm.analyze(x, hop_size=128)
+
+    # analysis positions on the cached frames, with the same analysis hop.
+    n = x.shape[-1]
+    s = np.array([[0, n - 1], [0, 4 * (n - 1)]])
+    y = tsm.synthesize(analysis, s, syn_hop_size=512)
+    assert np.allclose(y, tsm.phase_vocoder(x, s, syn_hop_size=512))
+
+    for alpha in [0.8, 1.1, 1.25]:
+        y = tsm.synthesize(analysis, alpha, phase_lock=True)
+        assert y.shape == tsm.phase_vocoder(x, alpha).shape
+        assert np.all(np.isfinite(y))
+
+    # without stretching, the input is reconstructed as phase_vocoder does.
+    y = tsm.synthesize(analysis, 1)
+    assert np.allclose(y, tsm.phase_vocoder(x, 1), atol=1e-8)
+    assert np.allclose(y, x, atol=1e-8)
+
+
+@pytest.mark.parametrize('alpha', [0.8, 1.25])
+def test_pv_analysis_cache_tones(alpha):
+    # stationary tones are stretched as phase_vocoder does,
+    # between analysis positions which are not on the cached frames.
+    sr = 22050
+    freqs = [220, 331, 1250, 2718]
+    t = np.arange(sr * 2) / sr
+    x = np.sum([np.sin(2 * np.pi * f * t) for f in freqs], axis=0)
+
+    y = tsm.synthesize(tsm.analyze(x), alpha)
+    y_ref = tsm.phase_vocoder(x, alpha)
+    spec = np.abs(tsm.utils.stft(y, ana_hop=512))
+    spec_ref = np.abs(tsm.utils.stft(y_ref, ana_hop=512))
+    assert np.linalg.norm(spec - spec_ref) / np.linalg.norm(spec_ref) < 0.02
+
+
+@pytest.mark.parametrize('block_frames', [1, 7, 100])
+@pytest.mark.parametrize('phase_lock', [True, False])
+def test_pv_block_frames(block_frames, phase_lock):
+    x, _ = sf.read('tests/data/castanetsviolin.wav')
+    x = np.stack([x, np.roll(x, 37)])
+
+    for s in [0.7, 1.3]:
+        y = tsm.phase_vocoder(x, s, phase_lock=phase_lock,
+                              block_frames=block_frames)
+        assert np.allclose(y, tsm.phase_vocoder(x, s, phase_lock=phase_lock))
@@ -0,0 +1,69 @@
+import pytest
+import pytsmod as tsm
+import numpy as np
+from pytsmod.tdpsolatsm import _grain_schedule, _overlap_add_grains
+from pytsmod.tdpsolatsm import _find_pitch_marks, _target_f0_to_beta
+
+
+@pytest.mark.parametrize('alpha', [0.8, 1, 1.3])
+@pytest.mark.parametrize('beta', [0.7, 1, 1.5])
+def test_tdpsola_grains(alpha, beta):
+    rng = np.random.default_rng(0)
+    pitch_period = rng.integers(100, 200, size=300)
+    pitch_mark = np.cumsum(pitch_period) + 200
+    beta_seq = np.full(pitch_period.size, beta)
+    pad_len = 400
+    output_length = int(np.ceil((pitch_mark[-1] + 200) * alpha))
+    x = rng.standard_normal(pitch_mark[-1] + 200 + 2 * pad_len)
+
+    # reference: one grain at a time with a linear nearest-mark search.
+    y_ref = np.zeros(output_length + 2 * pad_len)
+    ow = np.zeros(y_ref.shape)
+    tk = pitch_period[0] + 1
+    out_pm = []
+    src_idx = []
+    while np.round(tk) < output_length:
+        i = min(np.argmin(np.abs(alpha * pitch_mark - tk)),
+                pitch_period.size - 1)
+        pit = pitch_period[i]
+        win = tsm.utils.win('hann', 2 * pit + 1)
+        st = pitch_mark[i] - pit + pad_len
+        ini = int(round(tk)) - pit + pad_len
+        y_ref[ini: ini + 2 * pit + 1] += x[st: st + 2 * pit + 1] * win
+        ow[ini: ini + 2 * pit + 1] += win
+        out_pm.append(round(tk))
+        src_idx.append(i)
+        tk = tk + pit / beta_seq[i]
+    ow[ow < 1e-3] = 1
+    y_ref = y_ref / ow
+
+    sched = _grain_schedule(pitch_mark, pitch_period, beta_seq, alpha,
+                            output_length)
+    y = _overlap_add_grains(x, pitch_mark[sched[1]] + pad_len,
+                            sched[0] + pad_len, pitch_period[sched[1]],
+                            'hann', y_ref.size)
+
+    assert np.array_equal(sched[0], out_pm)
+    assert np.array_equal(sched[1], src_idx)
+    assert np.allclose(y, y_ref)
+
+
+@pytest.mark.parametrize('f0', [100, 220, 441])
+def test_find_pitch_marks(f0):
+    sr = 44100
+    hop_size = 441
+    x = np.sin(2 * np.pi * f0 * np.arange(sr) / sr)
+    f0_seq = np.full(sr // hop_size, f0, dtype=float)
+    f0_seq[20:40] = 0  # unvoiced frames keep the last period.
+
+    m = _find_pitch_marks(x, sr, f0_seq, hop_size, 1470)
+    period = round(sr / f0)
+
+    assert np.all(np.diff(m) == period)
+    assert m[0] == np.argmax(x[: period])
+    assert m[-1] > x.size - 2 * period
+    assert np.all(f0_seq == f0)
+
+    tgt_f0 = np.where(np.arange(f0_seq.size) < 50, 1.5 * f0, 0)
+    beta = _target_f0_to_beta(x, m, f0_seq, tgt_f0)
+    assert np.allclose(beta, np.where(m * f0_seq.size / x.size < 49.5, 1.5, 1))
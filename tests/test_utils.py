@@ -3,6 +3,7 @@ import pytsmod as tsm
 from scipy.io import loadmat
 import soundfile as sf
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
 
 @pytest.mark.parametrize('ana_hop', [1024, 2048])
@@ -49,3 +50,161 @@ def test_stft(ana_hop, win_type, win_size, zero_pad, fft_shift):
 
     x_matlab = matlab_results[5, :][0].squeeze()
     assert np.allclose(x, x_matlab)
+
+
+@pytest.mark.parametrize('ana_hop', [512, np.arange(0, 100000, 700)])
+@pytest.mark.parametrize('zero_pad', [0, 512])
+@pytest.mark.parametrize('fft_shift', [0, 1])
+def test_stft_frames(ana_hop, zero_pad, fft_shift):
+    x, _ = sf.read('tests/data/castanetsviolin.wav')
+
+    X = tsm.utils.stft(x, ana_hop, 'hann', 2048, zero_pad, fft_shift=fft_shift)
+
+    w = tsm.utils.win('hann', 2048, zero_pad)
+    x_padded = np.pad(x, (w.size // 2, w.size + np.max(ana_hop)))
+    if np.isscalar(ana_hop):
+        ana_hop = np.arange(X.shape[1]) * ana_hop
+    for i, pos in enumerate(ana_hop):
+        xi = x_padded[pos: pos + w.size] * w
+        if fft_shift:
+            xi = np.roll(xi, -(w.size // 2))
+        assert np.allclose(X[:, i], np.fft.fft(xi)[: w.size // 2 + 1])
+
+
+@pytest.mark.parametrize('syn_hop', [512, 700])
+@pytest.mark.parametrize('restore_energy', [False, True])
+@pytest.mark.parametrize('fft_shift', [0, 1])
+def test_istft_overlap_add(syn_hop, restore_energy, fft_shift):
+    x, _ = sf.read('tests/data/castanetsviolin.wav')
+    X = tsm.utils.stft(x, syn_hop, 'sin', 2048, fft_shift=fft_shift)
+
+    y = tsm.utils.istft(X, syn_hop, 'sin', 2048, fft_shift=fft_shift,
+                        restore_energy=restore_energy)
+
+    w = tsm.utils.win('sin', 2048)
+    y_loop = np.zeros((X.shape[1] - 1) * syn_hop + w.size)
+    ow = np.zeros(y_loop.size)
+    for i in range(X.shape[1]):
+        xi = np.real(np.fft.ifft(np.append(X[:, i], np.conj(X[-2: 0: -1, i]))))
+        if fft_shift:
+            xi = np.fft.fftshift(xi)
+        xiw = xi * w
+        if restore_energy:
+            xiw = xiw * np.sum(abs(xi)) / (np.sum(abs(xiw))
+                                           + np.finfo(np.float64).eps)
+        y_loop[i * syn_hop: i * syn_hop + w.size] += xiw
+        ow[i * syn_hop: i * syn_hop + w.size] += w ** 2
+    ow[ow < 1e-3] = 1
+    y_loop = (y_loop / ow)[w.size // 2: - w.size // 2]
+
+    assert np.allclose(y, y_loop)
+    if not restore_energy:
+        assert np.allclose(y[: x.size], x)
+
+
+@pytest.mark.parametrize('fft_shift', [0, 1])
+def test_istft_griffin_lim(fft_shift):
+    x, _ = sf.read('tests/data/castanetsviolin.wav')
+    X = tsm.utils.stft(x, 512, 'hann', 2048, fft_shift=fft_shift)
+
+    y = tsm.utils.istft(X, 512, 'hann', 2048, num_iter=3,
+                        original_length=x.size, fft_shift=fft_shift)
+
+    assert y.size == x.size
+    assert np.allclose(y, x)
+
+
+@pytest.mark.parametrize('zero_pad', [0, 512])
+def test_win_cache(zero_pad):
+    w = tsm.utils.win('hann', 1024, zero_pad)
+
+    assert w is tsm.utils.win('hann', 1024, zero_pad)
+    assert np.array_equal(w, np.pad(np.hanning(1024), zero_pad // 2))
+    assert not w.flags.writeable
+    with pytest.raises(ValueError):
+        w[0] = 1
+
+
+@pytest.mark.parametrize('func', [
+    lambda x: tsm.utils.istft(tsm.utils.stft(x, 512), 512),
+    lambda x: tsm.hptsm(x, 1.3, hp_median_backend='scipy'),
+    lambda x: tsm.hptsm(x, 0.8, hp_median_backend='numpy'),
+    lambda x: tsm.tdpsola(x, 44100,
+                          np.full((2, x.shape[-1] // 441 + 1), 150.),
+                          alpha=1.2, beta=1.1),
+])
+def test_num_threads(func):
+    x, _ = sf.read('tests/data/castanetsviolin.wav')
+    x = np.stack([x, np.roll(x, 100)])
+
+    y_ref = func(x)
+    with tsm.num_threads(4):
+        assert tsm.get_num_threads() == 4
+        y = func(x)
+    assert tsm.get_num_threads() == 1
+
+    # the results do not depend on the number of threads.
+    assert np.array_equal(y, y_ref)
+
+    with pytest.raises(Exception):
+        tsm.set_num_threads(0)
+    with pytest.raises(Exception):
+        tsm.set_num_threads(2.)
+
+    # numpy integers are taken as the number of threads.
+    with tsm.num_threads(np.int64(2)):
+        assert tsm.get_num_threads() == 2
+
+
+def test_num_threads_concurrent():
+    x, _ = sf.read('tests/data/castanetsviolin.wav')
+    x = np.stack([x, np.roll(x, 100)])
+    y_ref = tsm.hptsm(x, 1.3)
+
+    # each thread keeps its own number of threads,
+    # and the pool is not shut down while it is used.
+    def run(n):
+        with tsm.num_threads(n):
+            for _ in range(3):
+                assert tsm.get_num_threads() == n
+                assert np.array_equal(tsm.hptsm(x, 1.3), y_ref)
+
+    with ThreadPoolExecutor(3) as pool:
+        for result in [pool.submit(run, n) for n in [2, 3, 4]]:
+            result.result()
+    assert tsm.get_num_threads() == 1
+
+
+def test_profile():
+    x, sr = sf.read('tests/data/castanetsviolin.wav')
+    x = np.stack([x, np.roll(x, 100)])
+
+    records = []
+    with tsm.profile(callback=lambda *record: records.append(record),
+                     memory=True) as prof:
+        y = tsm.hptsm(x, 1.3)
+        tsm.wsola(x, 0.8)
+
+    stages = prof.stages
+    for stage in ['hptsm', 'hp_separate', 'median_filter', 'stft', 'istft',
+                  'phase_vocoder', 'phase_propagation', 'peak_picking',
+                  'ola', 'wsola', 'correlation_search', 'normalization']:
+        assert stages[stage]['calls'] > 0
+        assert stages[stage]['seconds'] >= 0
+    assert stages['wsola']['calls'] == 2
+    assert stages['stft']['frames'] > 0
+    assert stages['correlation_search']['frames'] \
+        == stages['correlation_search']['calls']
+    assert stages['hptsm']['peak_bytes'] > 0
+
+    # the callback gets every stage, and the report is sorted by time.
+    assert len(records) == sum(s['calls'] for s in stages.values())
+    seconds = [stage['seconds'] for stage in prof.report()]
+    assert seconds == sorted(seconds, reverse=True)
+    assert 'hptsm' in str(prof)
+
+    # nothing is recorded outside of the profile,
+    # and the output does not depend on it.
+    tsm.wsola(x, 0.8)
+    assert stages['wsola']['calls'] == 2
+    assert np.array_equal(y, tsm.hptsm(x, 1.3))
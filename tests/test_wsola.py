@@ -3,6 +3,7 @@ import pytsmod as tsm
 import numpy as np
 from scipy.io import loadmat
 import soundfile as sf
+from pytsmod.wsolatsm import _search, _cross_corr, _fft_size
 
 
 @pytest.mark.parametrize('alpha', [0.75, 1, 1.25])
@@ -62,3 +63,83 @@ def test_wsola_multichannel(n_chan, transpose):
 
     for i in range(x_multi_wsola.shape[0]):
         assert np.allclose(x_wsola, x_multi_wsola[i, :])
+
+
+@pytest.mark.parametrize('alpha', [0.7, 1.3, 2.5])
+@pytest.mark.parametrize('n_chan', [1, 2])
+@pytest.mark.parametrize('tolerance', [0, 512])
+def test_wsola_stream(alpha, n_chan, tolerance):
+    x, _ = sf.read('tests/data/castanetsviolin.wav')
+    x = np.stack([np.roll(x, 100 * c) for c in range(n_chan)]).squeeze()
+    y = tsm.wsola(x, alpha, tolerance=tolerance)
+
+    stream = tsm.WSOLAStream(alpha, n_chan=n_chan, tolerance=tolerance,
+                             length=x.shape[-1])
+    rng = np.random.default_rng(0)
+    y_blocks = []
+    pos = 0
+    while pos < x.shape[-1]:
+        block_size = rng.integers(1, 5000)
+        y_blocks.append(stream.process(x[..., pos: pos + block_size]))
+        pos += block_size
+
+        # the output is held back at most by the latency.
+        num_out = sum(y_block.shape[-1] for y_block in y_blocks)
+        assert (num_out
+                >= np.ceil(alpha * min(pos, x.shape[-1])) - stream.latency)
+    y_blocks.append(stream.flush())
+
+    assert np.array_equal(np.concatenate(y_blocks, axis=-1), y)
+
+
+@pytest.mark.parametrize('win_size', [512, 1024])
+@pytest.mark.parametrize('tolerance', [64, 512, 1024])
+def test_wsola_xcorr(win_size, tolerance):
+    x, _ = sf.read('tests/data/beethovenorchestra.wav')
+    x = np.stack([x, np.roll(x, 1000)])
+
+    y_direct = tsm.wsola(x, 1.3, win_size=win_size, syn_hop_size=win_size // 2,
+                         tolerance=tolerance, xcorr='direct')
+    y_fft = tsm.wsola(x, 1.3, win_size=win_size, syn_hop_size=win_size // 2,
+                      tolerance=tolerance, xcorr='fft')
+
+    assert np.allclose(y_direct, y_fft)
+
+
+@pytest.mark.parametrize('search_decimation', [2, 4, 8])
+def test_wsola_search_decimation(search_decimation):
+    x, _ = sf.read('tests/data/beethovenorchestra.wav')
+    x = np.stack([x, np.roll(x, 1000)])
+
+    y = tsm.wsola(x, 1.3)
+    y_dec = tsm.wsola(x, 1.3, search_decimation=search_decimation)
+
+    assert np.array_equal(tsm.wsola(x, 1.3, search_decimation=1), y)
+    assert y_dec.shape == y.shape
+
+    with pytest.raises(Exception):
+        tsm.wsola(x, 1.3, search_decimation=0)
+
+
+@pytest.mark.parametrize('search_decimation', [2, 4, 8])
+def test_wsola_search_decimation_bound(search_decimation):
+    x, _ = sf.read('tests/data/beethovenorchestra.wav')
+    win_size, tolerance = 1024, 512
+    n_fft = _fft_size(win_size, tolerance, 'auto', search_decimation)
+
+    # frame pairs around the natural progression of random windows.
+    rng = np.random.default_rng(0)
+    pos = rng.integers(tolerance, x.size - 2 * win_size - tolerance, 200)
+    next_pos = pos + win_size // 2 + rng.integers(-300, 300, pos.size)
+
+    ratio = []
+    for p, q in zip(pos, next_pos):
+        nat_prog = x[None, p: p + win_size]
+        x_next = x[None, q - tolerance: q + win_size + tolerance]
+        cross_corr = _cross_corr(nat_prog, x_next)[0]
+        delta = _search(nat_prog, x_next, tolerance, n_fft,
+                        search_decimation)[0]
+        assert -tolerance <= delta <= tolerance
+        ratio.append(cross_corr[delta + tolerance] / np.max(cross_corr))
+
+    assert np.mean(ratio) >= 0.98